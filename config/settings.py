@@ -7,4 +7,89 @@ SAVE_DIR = os.path.join(BASE_DIR,MEDIA_DIR)
 
 def join_path(directory,filename):
     filepath = os.path.join(directory,filename)
-    return filepath
\ No newline at end of file
+    return filepath
+
+# Cascade mode: the Pytesseract + spaCy result is kept when its confidence
+# score reaches the threshold, otherwise the card is escalated to the
+# backends below, tried in order (unavailable backends are skipped).
+CASCADE_THRESHOLD = 0.6
+CASCADE_ESCALATION = ['qwen2', 'azure']
+# weights of the confidence components (OCR conf, NER coverage, validity)
+CASCADE_WEIGHTS = {'ocr': 0.4, 'coverage': 0.3, 'validity': 0.3}
+
+# Image quality gate applied before any OCR/NER, Qwen2 or Azure call.
+# Sharpness is the variance of the Laplacian on a 500px wide grayscale copy.
+QUALITY_MIN_SHARPNESS = 60.0
+QUALITY_MIN_BRIGHTNESS = 40.0
+# Scored on the warp before the magic colour step. The test/ cards measure
+# 168-209 brightness with no clipping there; the digitally rendered
+# test3.jpg has 0.62 of its pixels at pure white.
+QUALITY_MAX_BRIGHTNESS = 240.0
+QUALITY_MAX_CLIPPED = 0.75  # fraction of pixels that are pure black or white
+QUALITY_MIN_SIZE = (300, 150)  # (width, height) of the card in pixels
+QUALITY_MIN_TEXT_DENSITY = 0.01  # fraction of pixels on text edges
+
+# Orientation estimation from projection profiles. Below these margins the
+# estimate is considered ambiguous and a single Tesseract OSD call decides.
+ORIENTATION_ASPECT_WEIGHT = 0.25
+ORIENTATION_MIN_LINE_MARGIN = 0.3
+ORIENTATION_MIN_UPRIGHT_MARGIN = 0.1
+# tallest text-line segment, as a fraction of the card's short side
+ORIENTATION_MAX_LINE_HEIGHT = 1 / 6
+
+# Multi-card detection: minimum card area as a fraction of the photo,
+# accepted long/short side ratio, maximum overlap before suppression and
+# the number of cards handled per photo.
+MULTI_CARD_MIN_AREA = 0.005
+MULTI_CARD_ASPECT_RANGE = (1.2, 2.2)
+MULTI_CARD_MAX_OVERLAP = 0.5
+MULTI_CARD_MAX_CARDS = 12
+MULTI_CARD_WORKERS = 4
+
+# Live camera scanning: exponential smoothing factor of the tracked quad,
+# maximum corner motion (pixels at 500px width) for a frame to count as
+# stable, sharpness required inside the quad, stable frames needed before
+# OCR fires, frames without a card before the track is dropped and idle
+# seconds before a stream is discarded.
+STREAM_SMOOTHING = 0.5
+STREAM_MAX_MOTION = 4.0
+STREAM_MIN_SHARPNESS = 60.0
+STREAM_STABLE_FRAMES = 8
+STREAM_MAX_MISSES = 5
+STREAM_IDLE_TIMEOUT = 120
+
+# Contact store: SQLite database fed by every successful scan. Contacts are
+# matched on email, on phone/website together with a similar name (shingle
+# Jaccard >= CONTACTS_KEY_MATCH_THRESHOLD), or on a MinHash (LSH banded)
+# estimate of NAME + ORG similarity >= CONTACTS_MATCH_THRESHOLD.
+CONTACTS_DB = os.path.join(BASE_DIR, 'data', 'contacts.db')
+CONTACTS_MINHASH_BANDS = 16
+CONTACTS_MINHASH_ROWS = 4
+CONTACTS_MATCH_THRESHOLD = 0.7
+CONTACTS_KEY_MATCH_THRESHOLD = 0.4
+
+# Model manager: RAM budget shared by all resident models (spaCy NER
+# variants and Qwen2), seconds a model may stay idle before it is evicted
+# and how often idle models are looked for. Evicted models are reloaded
+# on their next use.
+MODEL_RAM_BUDGET_MB = 6144
+MODEL_IDLE_TTL = 900
+MODEL_EVICTION_INTERVAL = 60
+# NER variant used by the Pytesseract path: 'best', 'last' or 'slim'
+# ('slim' is built from model-best with `python -m services.slim_model build`)
+NER_MODEL = 'best'
+NER_MODEL_PATHS = {
+    'best': './models/model-best/',
+    'last': './models/model-last/',
+    'slim': './models/model-slim/',
+}
+
+# Upload ingestion: uploads are decoded in memory. Bodies over
+# UPLOAD_MAX_BYTES are refused with 413 (Flask's MAX_CONTENT_LENGTH), and
+# images over UPLOAD_MAX_PIXELS are refused from their header before decoding.
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 40_000_000
+UPLOAD_FORMATS = ('jpeg', 'png', 'webp')
+# advertised to clients that can downscale before uploading; the scanner
+# works on a 500px wide copy and Tesseract needs ~300 dpi on the card
+UPLOAD_RECOMMENDED_MAX_SIDE = 2000
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 from flask import render_template
 import config.settings as settings
 import utils.utils as utils
@@ -12,38 +12,84 @@ from datetime import timedelta
 import requests
 import services.azureform as azureform
 import services.qwenform as qwenform
+import services.cascade as cascade
+import services.batch as batch
+import services.stream as stream
+import services.contacts as contacts
+from services.model_manager import manager
+import utils.quality as quality
+import utils.orientation as orientation
+import utils.metrics as metrics
+import utils.ingest as ingest
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 app.secret_key = 'document_scanner_app'
+# uploads are decoded in memory; bodies over the limit are refused with 413
+app.request_class = ingest.InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = settings.UPLOAD_MAX_BYTES
 # Set session to be permanent with longer timeout
 app.permanent_session_lifetime = timedelta(hours=1)
 
 docscan = utils.DocumentScan()
 
-# Initialize models
-qwen_model_loaded = False
-azure_model_loaded = False
-
 @app.route('/load_qwen_model', methods=['POST'])
 def load_qwen_model():
-    global qwen_model_loaded
     try:
-        if not qwen_model_loaded:
+        already_loaded = qwenform.is_available()
+        if not already_loaded:
             print("Loading Qwen model...")
-            qwen_result = qwenform.load_qwen_model()
-            if qwen_result["status"] == "success":
-                qwen_model_loaded = True
-                print("Qwen model loaded successfully")
-                return jsonify({"status": "success", "message": "Qwen model loaded successfully"})
-            else:
-                return jsonify({"status": "error", "message": qwen_result["message"]}), 500
-        else:
+        qwen_result = qwenform.load_qwen_model()
+        if qwen_result["status"] != "success":
+            return jsonify({"status": "error", "message": qwen_result["message"]}), 500
+        if already_loaded:
             return jsonify({"status": "success", "message": "Qwen model already loaded"})
+        print("Qwen model loaded successfully")
+        return jsonify({"status": "success", "message": "Qwen model loaded successfully"})
     except Exception as e:
         print(f"Error loading Qwen model: {str(e)}")
         return jsonify({"status": "error", "message": f"Failed to load Qwen model: {str(e)}"}), 500
 
+def quality_rejection(image, error_key="ERROR", reason_key="REASON"):
+    """
+    Run the image quality gate and return the results dict to render when
+    the image is rejected, or None when it is good enough to process. The
+    key names follow the backend's results dict (Azure uses lower case).
+    """
+    check = quality.check_image_quality(image)
+    if check['ok']:
+        return None
+    print(f"Image rejected by quality gate: {check['reason']} {check['scores']} ({check['elapsed_ms']} ms)")
+    return {error_key: check["message"], reason_key: check["reason"]}
+
+def save_overlay(overlay):
+    # the entity boxes are kept as JSON; the annotated JPEG is only rendered
+    # if /bounding_box.jpg is requested
+    overlay_path = settings.join_path(settings.MEDIA_DIR, 'overlay.json')
+    with open(overlay_path, 'w') as f:
+        json.dump(overlay, f)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    message = ingest.UploadRejected('too_large').message
+    if request.path == '/':
+        return render_template('scanner.html',
+                               ocr_model=session.get('ocr_model', 'pytesseract'),
+                               message=message), 413
+    return jsonify({"status": "error", "message": message}), 413
+
+@app.route('/upload_policy')
+def upload_policy():
+    """Upload limits and formats, for clients that downscale before uploading"""
+    return jsonify(ingest.upload_policy())
+
+@app.route('/upload_image')
+def upload_image():
+    # the original upload is kept in memory for the Qwen2/Azure result pages
+    if docscan.upload is None:
+        return jsonify({"status": "error", "message": "No image uploaded"}), 404
+    return Response(docscan.upload['data'], mimetype=docscan.upload['mimetype'])
+
 @app.route('/',methods=['GET','POST'])
 def scandoc():
     if request.method == 'POST':
@@ -54,10 +100,17 @@ def scandoc():
         session.permanent = True
         session['ocr_model'] = ocr_model
         
-        upload_image_path = utils.save_upload_image(file)
-        print('Image saved in = ',upload_image_path)
+        try:
+            image, upload = ingest.decode_upload(file)
+        except ingest.UploadRejected as e:
+            print(f"Upload rejected: {e.reason}")
+            return render_template('scanner.html',
+                                   ocr_model=ocr_model,
+                                   message=e.message), e.status
+        print(f"Upload decoded in memory: {upload['format']} {upload['width']}x{upload['height']}, {upload['bytes']} bytes")
+        docscan.upload = upload
         # predict the coordination of the document
-        four_points, size = docscan.document_scanner(upload_image_path)
+        four_points, size = docscan.document_scanner_image(image)
         print(four_points,size)
         if four_points is None:
             message ='UNABLE TO LOCATE THE COORDINATES OF DOCUMENT: points displayed are random'
@@ -94,7 +147,15 @@ def transform():
             
         points = request.json['data']
         array = np.array(points)
-        magic_color = docscan.calibrate_to_original_size(array)
+        # the quality gate scores the warp before the magic colour step,
+        # which saturates white card stock
+        wrap_image = docscan.warp_to_original_size(array)
+        docscan.wrap_image = wrap_image
+        magic_color = docscan.apply_brightness_contrast(wrap_image,brightness=40,contrast=60)
+        # rotate the card upright once so OCR doesn't have to retry rotations
+        magic_color, angle, method = orientation.normalize_orientation(magic_color)
+        if angle:
+            print(f"Rotated document by {angle} degrees ({method})")
         filename = 'magic_color.jpg'
         magic_image_path = settings.join_path(settings.MEDIA_DIR,filename)
         cv2.imwrite(magic_image_path,magic_color)
@@ -111,52 +172,84 @@ def prediction():
     
     if ocr_model == 'qwen2':
         # Check if Qwen model is loaded
-        if not qwen_model_loaded:
+        if not qwenform.is_available():
             return render_template('qwen_prediction.html', 
                                   results={"ERROR": "Qwen2 model not loaded. Please load the model first."})
         
-        # Use Qwen2 model for entity extraction
-        upload_image_path = settings.join_path(settings.MEDIA_DIR, 'upload.jpg')
-        
-        # Check if the image exists
-        if not os.path.exists(upload_image_path):
-            return render_template('qwen_prediction.html', 
-                                  results={"ERROR": "Image file not found. Please upload an image first."})
-        
-        # Save a copy for display as bounding box image
-        bb_filename = settings.join_path(settings.MEDIA_DIR, 'bounding_box.jpg')
-        image = cv2.imread(upload_image_path)
-        
+        # Use Qwen2 model for entity extraction on the upload held in memory
+        image = docscan.image
         if image is None:
             return render_template('qwen_prediction.html', 
-                                  results={"ERROR": "Failed to read image file. The file may be corrupted."})
+                                  results={"ERROR": "Image file not found. Please upload an image first."})
         
-        cv2.imwrite(bb_filename, image)
+        rejection = quality_rejection(image)
+        if rejection is not None:
+            return render_template('qwen_prediction.html', results=rejection)
         
         # Process document using qwenform
-        results = qwenform.process_document(upload_image_path)
+        results = qwenform.process_array(image)
+        contacts.record_scan(results, 'qwen2')
         return render_template('qwen_prediction.html', results=results)
         
     elif ocr_model == 'azure':
         try:
-            # Use the uploaded image path
-            upload_image_path = settings.join_path(settings.MEDIA_DIR, 'upload.jpg')
-            if not os.path.exists(upload_image_path):
+            # Use the upload held in memory
+            if docscan.image is None:
                 return render_template('azure_prediction.html', 
                                       results={"error": "Image file not found. Please upload an image first."})
 
-            results = azureform.process_business_card(upload_image_path)
+            rejection = quality_rejection(docscan.image, error_key="error", reason_key="reason")
+            if rejection is not None:
+                return render_template('azure_prediction.html', results=rejection)
+
+            results = azureform.process_business_card_bytes(
+                ingest.encode_upload(docscan.upload, docscan.image))
             print(results)
+            contacts.record_scan(results, 'azure')
             return render_template('azure_prediction.html', results=results)
         except Exception as e:
             return render_template('azure_prediction.html', results={"error": f"Azure processing error: {str(e)}"})
+    elif ocr_model == 'cascade':
+        try:
+            wrap_image_filepath = settings.join_path(settings.MEDIA_DIR,'magic_color.jpg')
+            if not os.path.exists(wrap_image_filepath) or docscan.wrap_image is None:
+                return render_template('predictions.html',
+                                      results={"ERROR": "Wrapped image not found. Please process the document first."})
+
+            image = cv2.imread(wrap_image_filepath)
+            if image is None:
+                return render_template('predictions.html',
+                                      results={"ERROR": "Failed to read wrapped image. The file may be corrupted."})
+
+            rejection = quality_rejection(docscan.wrap_image)
+            if rejection is not None:
+                return render_template('predictions.html', results=rejection)
+
+            outcome = cascade.process_cascade(image, docscan.image, docscan.upload)
+            print(f"Cascade answered by {outcome['tier']} (confidence {outcome['confidence']})")
+
+            save_overlay(outcome['overlay'])
+            contacts.record_scan(outcome['results'], outcome['tier'])
+
+            templates = {'pytesseract': 'predictions.html',
+                         'qwen2': 'qwen_prediction.html',
+                         'azure': 'azure_prediction.html'}
+            return render_template(templates[outcome['tier']],
+                                   results=outcome['results'],
+                                   overlay=outcome['overlay'],
+                                   tier=outcome['tier'],
+                                   confidence=outcome['confidence'])
+        except Exception as e:
+            print(f"Unhandled exception in cascade processing: {str(e)}")
+            return render_template('predictions.html',
+                                  results={"ERROR": f"Error in document processing: {str(e)}"})
     else:
         try:
             # load the wrap image for Pytesseract/Spacy processing
             wrap_image_filepath = settings.join_path(settings.MEDIA_DIR,'magic_color.jpg')
             
             # Check if the wrapped image exists
-            if not os.path.exists(wrap_image_filepath):
+            if not os.path.exists(wrap_image_filepath) or docscan.wrap_image is None:
                 return render_template('predictions.html', 
                                       results={"ERROR": "Wrapped image not found. Please process the document first."})
                 
@@ -166,22 +259,169 @@ def prediction():
                 return render_template('predictions.html', 
                                       results={"ERROR": "Failed to read wrapped image. The file may be corrupted."})
                 
+            rejection = quality_rejection(docscan.wrap_image)
+            if rejection is not None:
+                return render_template('predictions.html', results=rejection)
+
             # Use the original Pytesseract + SpaCy NER method
-            image_bb, results = pred.getPredictions(image)
-            
-            bb_filename = settings.join_path(settings.MEDIA_DIR,'bounding_box.jpg') 
-            cv2.imwrite(bb_filename, image_bb)
+            overlay, results = pred.getPredictions(image)
+            save_overlay(overlay)
+            contacts.record_scan(results, 'pytesseract')
             
             # If results contain an ERROR key, it means the prediction failed
             if "ERROR" in results:
                 print(f"Error in Pytesseract processing: {results['ERROR']}")
                 
-            return render_template('predictions.html', results=results)
+            return render_template('predictions.html', results=results, overlay=overlay)
         except Exception as e:
             print(f"Unhandled exception in Pytesseract processing: {str(e)}")
             return render_template('predictions.html', 
                                   results={"ERROR": f"Error in document processing: {str(e)}"})
 
+@app.route('/bounding_box.jpg')
+def bounding_box_image():
+    """
+    Server-rendered annotated image, generated lazily from the warped image
+    and the last overlay and cached until either of them changes.
+    """
+    overlay_path = settings.join_path(settings.MEDIA_DIR, 'overlay.json')
+    wrap_image_filepath = settings.join_path(settings.MEDIA_DIR, 'magic_color.jpg')
+    bb_filename = settings.join_path(settings.MEDIA_DIR, 'bounding_box.jpg')
+
+    if not os.path.exists(overlay_path) or not os.path.exists(wrap_image_filepath):
+        return jsonify({"status": "error", "message": "No prediction available"}), 404
+
+    sources_mtime = max(os.path.getmtime(overlay_path), os.path.getmtime(wrap_image_filepath))
+    if not os.path.exists(bb_filename) or os.path.getmtime(bb_filename) < sources_mtime:
+        with open(overlay_path) as f:
+            overlay = json.load(f)
+        image = cv2.imread(wrap_image_filepath)
+        if image is None:
+            return jsonify({"status": "error", "message": "Failed to read wrapped image"}), 500
+        cv2.imwrite(bb_filename, pred.render_overlay(image, overlay))
+
+    return send_file(os.path.abspath(bb_filename), mimetype='image/jpeg')
+
+@app.route('/scan_batch', methods=['POST'])
+def scan_batch():
+    """
+    Scan a photo of several cards laid out on a table: every card is
+    located, warped and sent through the selected backend in parallel.
+    """
+    if 'image_name' not in request.files:
+        return jsonify({"status": "error", "message": "No image uploaded"}), 400
+
+    file = request.files['image_name']
+    ocr_model = request.form.get('ocr_model', session.get('ocr_model', 'pytesseract'))
+    if ocr_model == 'qwen2' and not qwenform.is_available():
+        return jsonify({"status": "error", "message": "Qwen2 model not loaded. Please load the model first."}), 400
+
+    try:
+        image, upload = ingest.decode_upload(file)
+        response = batch.process_photo(image, ocr_model)
+        response['status'] = 'success'
+        return jsonify(response)
+    except ingest.UploadRejected as e:
+        return jsonify({"status": "error", "reason": e.reason, "message": e.message}), e.status
+    except Exception as e:
+        print(f"Error in batch scan: {str(e)}")
+        return jsonify({"status": "error", "message": f"Error in batch processing: {str(e)}"}), 500
+
+@app.route('/live')
+def live():
+    ocr_model = session.get('ocr_model', 'pytesseract')
+    return render_template('live_scan.html', ocr_model=ocr_model)
+
+@app.route('/stream/start', methods=['POST'])
+def stream_start():
+    data = request.get_json(silent=True) or {}
+    ocr_model = data.get('ocr_model', session.get('ocr_model', 'pytesseract'))
+    if ocr_model == 'qwen2' and not qwenform.is_available():
+        return jsonify({"status": "error", "message": "Qwen2 model not loaded. Please load the model first."}), 400
+    stream_id = stream.create_stream(ocr_model)
+    return jsonify({"status": "success", "stream_id": stream_id})
+
+@app.route('/stream/<stream_id>/frame', methods=['POST'])
+def stream_frame(stream_id):
+    # a single JPEG frame, either as the raw body or as the 'frame' file field
+    if 'frame' in request.files:
+        frame_bytes = request.files['frame'].read()
+    else:
+        frame_bytes = request.get_data()
+
+    state = stream.process_frame(stream_id, frame_bytes)
+    if state is None:
+        return jsonify({"status": "error", "message": "Unknown stream"}), 404
+    return jsonify(state)
+
+@app.route('/stream/<stream_id>/mjpeg', methods=['POST'])
+def stream_mjpeg(stream_id):
+    """
+    Accept an MJPEG (or chunked concatenated JPEG) upload and answer with one
+    JSON line of tracker state per frame while the upload is still running.
+    """
+    if stream.get_stream(stream_id) is None:
+        return jsonify({"status": "error", "message": "Unknown stream"}), 404
+
+    def generate():
+        for frame_bytes in stream.iter_mjpeg_frames(request.stream):
+            state = stream.process_frame(stream_id, frame_bytes)
+            if state is None:
+                break
+            yield json.dumps(state) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/stream/<stream_id>/stop', methods=['POST'])
+def stream_stop(stream_id):
+    if not stream.close_stream(stream_id):
+        return jsonify({"status": "error", "message": "Unknown stream"}), 404
+    return jsonify({"status": "success"})
+
+@app.route('/contacts/export')
+def contacts_export():
+    """Stream every stored contact as CSV, vCard or JSON lines"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in contacts.EXPORTERS:
+        return jsonify({"status": "error",
+                        "message": f"Unknown format, use one of {', '.join(contacts.EXPORTERS)}"}), 400
+
+    exporter, mimetype, filename = contacts.EXPORTERS[export_format]
+    return Response(stream_with_context(exporter(contacts.iter_contacts())),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/models')
+def models_stats():
+    return jsonify(manager.stats())
+
+@app.route('/models/<name>/load', methods=['POST'])
+def models_load(name):
+    if name not in manager.entries:
+        return jsonify({"status": "error", "message": "Unknown model"}), 404
+    try:
+        if name == 'qwen2':
+            result = qwenform.load_qwen_model()
+            if result["status"] != "success":
+                return jsonify(result), 500
+        else:
+            manager.get(name)
+        return jsonify({"status": "success", "models": manager.stats()['models']})
+    except Exception as e:
+        print(f"Error loading model {name}: {str(e)}")
+        return jsonify({"status": "error", "message": f"Failed to load model: {str(e)}"}), 500
+
+@app.route('/models/<name>/unload', methods=['POST'])
+def models_unload(name):
+    if name not in manager.entries:
+        return jsonify({"status": "error", "message": "Unknown model"}), 404
+    unloaded = manager.unload(name)
+    return jsonify({"status": "success", "unloaded": unloaded, "models": manager.stats()['models']})
+
+@app.route('/metrics')
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
 @app.route('/about')
 def about():
     return render_template('about.html')
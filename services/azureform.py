@@ -6,7 +6,16 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-def process_business_card(image_path):
+def process_business_card_bytes(image_data):
+    """
+    Analyze an encoded JPEG image held in memory
+    
+    Args:
+        image_data (bytes): JPEG encoded image
+    
+    Returns:
+        dict: Structured business card data or an error
+    """
     # Azure Form Recognizer configuration
     endpoint = os.getenv('AZURE_FORM_RECOGNIZER_ENDPOINT')
     api_key = os.getenv('AZURE_FORM_RECOGNIZER_KEY')
@@ -25,13 +34,6 @@ def process_business_card(image_path):
         "includeTextDetails": True
     }
     
-    # Read image data
-    try:
-        with open(image_path, "rb") as image_file:
-            image_data = image_file.read()
-    except Exception as e:
-        return {"error": f"Failed to read image file: {str(e)}"}
-    
     # Submit the image for analysis
     try:
         response = requests.post(analyze_url, data=image_data, headers=headers, params=params)
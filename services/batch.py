@@ -0,0 +1,130 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import config.settings as settings
+import utils.utils as utils
+import utils.quality as quality
+import utils.orientation as orientation
+import services.predictions as pred
+import services.qwenform as qwenform
+import services.azureform as azureform
+import services.cascade as cascade
+import services.contacts as contacts
+
+
+def run_backend(card, ocr_model):
+    """
+    Run the selected backend on one warped card held in memory
+
+    Returns:
+        tuple: (backend that answered, results dict, entity box overlay or
+               None when the backend doesn't locate fields)
+    """
+    if ocr_model == 'qwen2':
+        return 'qwen2', qwenform.process_array(card), None
+    if ocr_model == 'azure':
+        _, buffer = cv2.imencode('.jpg', card)
+        return 'azure', azureform.process_business_card_bytes(buffer.tobytes()), None
+    if ocr_model == 'cascade':
+        outcome = cascade.process_cascade(card)
+        overlay = outcome['overlay'] if outcome['tier'] == 'pytesseract' else None
+        return outcome['tier'], outcome['results'], overlay
+
+    overlay, results = pred.getPredictions(card)
+    return 'pytesseract', results, overlay
+
+
+def prepare_card(docscan, index, four_points):
+    """
+    Warp, rotate and quality-check one card.
+
+    Returns:
+        tuple: (card result dict, card image or None when rejected)
+    """
+    polygon_orig = (four_points * docscan.image.shape[1] / docscan.size[0]).astype(int)
+    card_result = {
+        'index': index,
+        'polygon': utils.array_to_json_format(four_points),
+        'polygon_original': utils.array_to_json_format(polygon_orig),
+        'backend': None,
+        'overlay': None,
+    }
+
+    try:
+        # scored before the magic colour step, which saturates white stock
+        wrap_image = docscan.warp_to_original_size(four_points)
+        check = quality.check_image_quality(wrap_image)
+        if not check['ok']:
+            card_result['results'] = {"ERROR": check['message'], "REASON": check['reason']}
+            return card_result, None
+
+        card = docscan.apply_brightness_contrast(wrap_image, brightness=40, contrast=60)
+        card, angle, method = orientation.normalize_orientation(card)
+        card_result['rotation'] = angle
+        return card_result, card
+    except Exception as e:
+        print(f"Error preparing card {index}: {str(e)}")
+        card_result['results'] = {"ERROR": f"Error in card processing: {str(e)}"}
+        return card_result, None
+
+
+def process_card(card_result, card, ocr_model):
+    try:
+        backend, results, overlay = run_backend(card, ocr_model)
+        card_result['backend'] = backend
+        card_result['results'] = results
+        card_result['overlay'] = overlay
+    except Exception as e:
+        print(f"Error processing card {card_result['index']}: {str(e)}")
+        card_result['results'] = {"ERROR": f"Error in card processing: {str(e)}"}
+    return card_result
+
+
+def process_photo(image, ocr_model='pytesseract'):
+    """
+    Detect every card in a photo and run each one through the selected
+    backend in parallel. Pytesseract cards share a single batched NER pass.
+
+    Args:
+        image (numpy.ndarray): decoded photo of one or more cards
+        ocr_model (str): pytesseract, qwen2, azure or cascade
+
+    Returns:
+        dict: one entry per card with its polygon in resized (``polygon``)
+              and original (``polygon_original``) coordinates, results and
+              the entity box overlay in warped card coordinates
+    """
+    start = time.perf_counter()
+    # own scanner instance: the shared one in main.py holds the single
+    # upload flow's state
+    docscan = utils.DocumentScan()
+    cards, size = docscan.document_scanner_multi_image(image)
+    print(f"Located {len(cards)} cards")
+
+    with ThreadPoolExecutor(max_workers=settings.MULTI_CARD_WORKERS) as executor:
+        prepared = list(executor.map(lambda item: prepare_card(docscan, *item), enumerate(cards)))
+        ready = [(card_result, card) for card_result, card in prepared if card is not None]
+
+        if ocr_model == 'pytesseract':
+            outputs = pred.getPredictionsBatch([card for _, card in ready],
+                                               workers=settings.MULTI_CARD_WORKERS)
+            for (card_result, _), (overlay, results) in zip(ready, outputs):
+                card_result['backend'] = 'pytesseract'
+                card_result['results'] = results
+                card_result['overlay'] = overlay
+        else:
+            list(executor.map(lambda item: process_card(item[0], item[1], ocr_model), ready))
+
+    for card_result, card in ready:
+        card_result['contact'] = contacts.record_scan(card_result['results'], card_result['backend'])
+
+    results = [card_result for card_result, _ in prepared]
+    return {
+        'count': len(results),
+        'size': {'width': size[0], 'height': size[1]},
+        'ocr_model': ocr_model,
+        'cards': results,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,139 @@
+import os
+import re
+
+import config.settings as settings
+import utils.ingest as ingest
+import services.predictions as pred
+import services.qwenform as qwenform
+import services.azureform as azureform
+
+# Fields a business card is expected to carry; used for NER coverage.
+EXPECTED_FIELDS = ('NAME', 'ORG', 'PHONE', 'EMAIL')
+
+EMAIL_RE = re.compile(r'^[a-z0-9._%+\-]+@[a-z0-9.\-]+\.[a-z]{2,}$')
+PHONE_RE = re.compile(r'^\d{7,15}$')
+
+
+def field_validity(entities):
+    """
+    Fraction of extracted PHONE and EMAIL values that have a plausible shape.
+    Returns None when the card has neither field.
+    """
+    checks = []
+    for phone in entities.get('PHONE', []):
+        checks.append(bool(PHONE_RE.match(re.sub(r'\D', '', str(phone)))))
+    for email in entities.get('EMAIL', []):
+        checks.append(bool(EMAIL_RE.match(str(email).lower())))
+
+    if not checks:
+        return None
+    return sum(checks) / len(checks)
+
+
+def confidence_score(entities, stats):
+    """
+    Combine Tesseract confidence, NER coverage and field validity into a
+    single score between 0 and 1.
+
+    Args:
+        entities (dict): entities returned by pred.getPredictions
+        stats (dict): OCR statistics filled in by pred.getPredictions
+
+    Returns:
+        tuple: (score, components dict)
+    """
+    if "ERROR" in entities:
+        return 0.0, {'ocr': 0.0, 'coverage': 0.0, 'validity': 0.0}
+
+    ocr = min(max(stats.get('ocr_conf', 0.0) / 100.0, 0.0), 1.0)
+
+    found = [field for field in EXPECTED_FIELDS if entities.get(field)]
+    coverage = len(found) / len(EXPECTED_FIELDS)
+
+    validity = field_validity(entities)
+    if validity is None:
+        # no phone or email at all is as bad as an invalid one
+        validity = 0.0
+
+    components = {'ocr': ocr, 'coverage': coverage, 'validity': validity}
+    weights = settings.CASCADE_WEIGHTS
+    score = sum(weights[k] * components[k] for k in components) / sum(weights.values())
+
+    return round(score, 3), components
+
+
+def backend_available(backend):
+    if backend == 'qwen2':
+        return qwenform.is_available()
+    if backend == 'azure':
+        return bool(os.getenv('AZURE_FORM_RECOGNIZER_ENDPOINT')) and \
+            bool(os.getenv('AZURE_FORM_RECOGNIZER_KEY'))
+    return False
+
+
+def escalate(backend, image, upload_image=None, upload=None):
+    # without the original upload the warped card itself is sent
+    source = upload_image if upload_image is not None else image
+    if backend == 'qwen2':
+        results = qwenform.process_array(source)
+        failed = "ERROR" in results
+    else:
+        results = azureform.process_business_card_bytes(ingest.encode_upload(upload, source))
+        failed = "error" in results
+    return results, failed
+
+
+def process_cascade(image, upload_image=None, upload=None, threshold=None):
+    """
+    Run the cheap Pytesseract + spaCy path first and only escalate to the
+    Qwen2 or Azure backends when its confidence is below the threshold.
+
+    Args:
+        image (numpy.ndarray): warped card image for Pytesseract
+        upload_image (numpy.ndarray): decoded original upload used by the
+            escalation tiers; the warped card is used when None
+        upload (dict): ingest info of the upload, its encoded bytes are
+            forwarded to Azure as they are
+        threshold (float): confidence threshold, defaults to settings
+
+    Returns:
+        dict: tier that answered, its results, the cheap path score and the
+              vector overlay of the cheap path's entity boxes
+    """
+    if threshold is None:
+        threshold = settings.CASCADE_THRESHOLD
+
+    stats = {}
+    overlay, results = pred.getPredictions(image, stats=stats)
+    score, components = confidence_score(results, stats)
+    print(f"Cascade: pytesseract confidence {score} {components}")
+
+    cascade = {
+        'tier': 'pytesseract',
+        'results': results,
+        'confidence': score,
+        'components': components,
+        'threshold': threshold,
+        'overlay': overlay,
+        'attempted': [],
+    }
+    if score >= threshold:
+        return cascade
+
+    for backend in settings.CASCADE_ESCALATION:
+        if not backend_available(backend):
+            print(f"Cascade: {backend} not available, skipping")
+            continue
+
+        print(f"Cascade: escalating to {backend}")
+        tier_results, failed = escalate(backend, image, upload_image, upload)
+        cascade['attempted'].append(backend)
+        if failed:
+            print(f"Cascade: {backend} failed: {tier_results}")
+            continue
+
+        cascade['tier'] = backend
+        cascade['results'] = tier_results
+        return cascade
+
+    return cascade
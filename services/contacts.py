@@ -0,0 +1,418 @@
+import csv
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+import config.settings as settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    org TEXT,
+    title TEXT,
+    phones TEXT,
+    emails TEXT,
+    webs TEXT,
+    sources TEXT,
+    signature BLOB,
+    scans INTEGER DEFAULT 1,
+    created REAL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS contact_keys (
+    kind TEXT,
+    value TEXT,
+    contact_id INTEGER,
+    PRIMARY KEY (kind, value, contact_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS contact_bands (
+    band INTEGER,
+    bucket INTEGER,
+    contact_id INTEGER,
+    PRIMARY KEY (band, bucket, contact_id)
+) WITHOUT ROWID;
+"""
+
+_lock = threading.Lock()
+
+MERSENNE_PRIME = (1 << 61) - 1
+NUM_PERM = settings.CONTACTS_MINHASH_BANDS * settings.CONTACTS_MINHASH_ROWS
+# fixed seed so signatures stay comparable across processes
+_rng = random.Random(1)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME))
+                for _ in range(NUM_PERM)]
+
+
+def connect(db_path=None):
+    db_path = db_path or settings.CONTACTS_DB
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# --- normalisation ---------------------------------------------------------
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', str(phone))
+    if len(digits) < 7:
+        return None
+    # compare on the national part so +44 20... and 020... meet
+    return digits[-10:]
+
+
+def normalize_email(email):
+    email = str(email).strip().lower()
+    return email if re.match(r'^[^@\s]+@[^@\s]+\.[a-z]{2,}$', email) else None
+
+
+def normalize_web(web):
+    web = str(web).strip().lower()
+    web = re.sub(r'^[a-z]+://', '', web)
+    web = re.sub(r'^www\.', '', web)
+    domain = web.split('/')[0]
+    return domain if '.' in domain else None
+
+
+def as_list(value):
+    """
+    Values of a backend's entity dict as a list. Qwen2 output is parsed from
+    model-generated JSON and may hold a single string instead of a list.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v is not None]
+    return [value]
+
+
+def to_contact(results):
+    """
+    Map the entity dict of any backend to a common contact record.
+    Pytesseract and Qwen2 return NAME/ORG/DES/PHONE/EMAIL/WEB lists, Azure
+    returns an ``entities`` dict with name/company/jobTitle/... fields.
+    """
+    if 'entities' in results:
+        entities = results['entities']
+        name = entities.get('name') or {}
+        return {
+            'name': " ".join(v for v in (name.get('firstName'), name.get('lastName')) if v),
+            'org': ", ".join(map(str, as_list(entities.get('company')))),
+            'title': ", ".join(map(str, as_list(entities.get('jobTitle')))),
+            'phones': as_list(entities.get('phone')) + as_list(entities.get('fax')),
+            'emails': as_list(entities.get('email')),
+            'webs': as_list(entities.get('website')),
+        }
+
+    return {
+        'name': " ".join(map(str, as_list(results.get('NAME')))),
+        'org': " ".join(map(str, as_list(results.get('ORG')))),
+        'title': " ".join(map(str, as_list(results.get('DES')))),
+        'phones': as_list(results.get('PHONE')),
+        'emails': as_list(results.get('EMAIL')),
+        'webs': as_list(results.get('WEB')),
+    }
+
+
+def contact_keys(contact):
+    keys = set()
+    for kind, values, normalize in (('phone', contact['phones'], normalize_phone),
+                                    ('email', contact['emails'], normalize_email),
+                                    ('web', contact['webs'], normalize_web)):
+        for value in values:
+            value = normalize(value)
+            if value:
+                keys.add((kind, value))
+    return keys
+
+
+# --- MinHash / LSH ---------------------------------------------------------
+
+def shingles(text, k=3):
+    text = re.sub(r'[^a-z0-9 ]', '', str(text).lower())
+    text = " ".join(text.split())
+    if not text:
+        return set()
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def minhash(contact):
+    features = {'n:' + s for s in shingles(contact['name'])} | \
+        {'o:' + s for s in shingles(contact['org'])}
+    if not features:
+        return None
+    hashes = [zlib.crc32(f.encode('utf-8')) for f in features]
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+
+def pack_signature(signature):
+    return struct.pack(f'<{NUM_PERM}Q', *signature)
+
+
+def unpack_signature(blob):
+    return list(struct.unpack(f'<{NUM_PERM}Q', blob))
+
+
+def similarity(sig_a, sig_b):
+    # estimated Jaccard similarity of the shingle sets
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERM
+
+
+def band_buckets(signature):
+    rows = settings.CONTACTS_MINHASH_ROWS
+    return [(band, zlib.crc32(struct.pack(f'<{rows}Q', *signature[band * rows:(band + 1) * rows])))
+            for band in range(settings.CONTACTS_MINHASH_BANDS)]
+
+
+# --- store -----------------------------------------------------------------
+
+def jaccard(a, b):
+    if not a or not b:
+        return None
+    return len(a & b) / len(a | b)
+
+
+def find_match(conn, contact, keys, signature):
+    """
+    Look the contact up through the key and LSH indexes only, so the cost
+    depends on the number of candidates, not on the size of the store.
+
+    An email match is decisive. A shared phone or website (switchboards and
+    company sites are shared by colleagues) only counts when the names are
+    similar and the email addresses don't contradict it. Without a key, the
+    MinHash estimate over NAME + ORG has to reach CONTACTS_MATCH_THRESHOLD.
+
+    Returns:
+        tuple: (contact id, match type) or (None, None)
+    """
+    key_hits = {}
+    for kind, value in keys:
+        for row in conn.execute('SELECT contact_id FROM contact_keys WHERE kind = ? AND value = ?',
+                                (kind, value)):
+            key_hits.setdefault(row['contact_id'], set()).add(kind)
+
+    for contact_id, kinds in key_hits.items():
+        if 'email' in kinds:
+            return contact_id, 'email'
+
+    lsh_hits = set()
+    if signature is not None:
+        for band, bucket in band_buckets(signature):
+            for row in conn.execute('SELECT contact_id FROM contact_bands WHERE band = ? AND bucket = ?',
+                                    (band, bucket)):
+                lsh_hits.add(row['contact_id'])
+
+    emails = {normalize_email(e) for e in contact['emails']} - {None}
+    name = shingles(contact['name'])
+    best = (None, None, 0.0)
+    for contact_id in set(key_hits) | lsh_hits:
+        row = conn.execute('SELECT name, emails, signature FROM contacts WHERE id = ?',
+                           (contact_id,)).fetchone()
+        if row is None:
+            continue
+        row_emails = {normalize_email(e) for e in json.loads(row['emails'])} - {None}
+        if emails and row_emails and not emails & row_emails:
+            continue
+
+        if contact_id in key_hits:
+            score = jaccard(name, shingles(row['name']))
+            # a shared phone or website with no name to contradict it
+            score = 1.0 if score is None else score
+            threshold = settings.CONTACTS_KEY_MATCH_THRESHOLD
+            match_type = sorted(key_hits[contact_id])[0]
+        else:
+            score = similarity(signature, unpack_signature(row['signature']))
+            threshold = settings.CONTACTS_MATCH_THRESHOLD
+            match_type = 'name_org'
+        if score >= threshold and score > best[2]:
+            best = (contact_id, match_type, score)
+
+    return best[0], best[1]
+
+
+def merge_values(existing, new, normalize=None):
+    """
+    Append the new values that aren't already present. With ``normalize``
+    values are compared on their normalised form (values it can't normalise
+    are compared as they are), so "+44 20 7946 0000" and "020 7946 0000"
+    are kept once.
+    """
+    def key(value):
+        return (normalize(value) if normalize else None) or value
+
+    merged = list(existing)
+    seen = {key(value) for value in merged}
+    for value in new:
+        if value and key(value) not in seen:
+            merged.append(value)
+            seen.add(key(value))
+    return merged
+
+
+def index_contact(conn, contact_id, keys, signature):
+    conn.executemany('INSERT OR IGNORE INTO contact_keys (kind, value, contact_id) VALUES (?, ?, ?)',
+                     [(kind, value, contact_id) for kind, value in keys])
+    if signature is not None:
+        conn.execute('DELETE FROM contact_bands WHERE contact_id = ?', (contact_id,))
+        conn.executemany('INSERT OR IGNORE INTO contact_bands (band, bucket, contact_id) VALUES (?, ?, ?)',
+                         [(band, bucket, contact_id) for band, bucket in band_buckets(signature)])
+
+
+def add_scan(results, source, db_path=None):
+    """
+    Store the entities of one scan, merging them into an existing contact
+    when the indexes find a match.
+
+    Args:
+        results (dict): entity dict from any backend
+        source (str): backend name (pytesseract, qwen2, azure)
+
+    Returns:
+        dict: contact id, whether it matched an existing contact and how,
+              or None when the scan has nothing to store
+    """
+    if not results or "ERROR" in results or "error" in results:
+        return None
+
+    contact = to_contact(results)
+    keys = contact_keys(contact)
+    signature = minhash(contact)
+    if not keys and signature is None:
+        return None
+
+    now = time.time()
+    with _lock:
+        conn = connect(db_path)
+        try:
+            with conn:
+                contact_id, match_type = find_match(conn, contact, keys, signature)
+                if contact_id is None:
+                    cursor = conn.execute(
+                        'INSERT INTO contacts (name, org, title, phones, emails, webs, sources, '
+                        'signature, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (contact['name'], contact['org'], contact['title'],
+                         json.dumps(contact['phones']), json.dumps(contact['emails']),
+                         json.dumps(contact['webs']), json.dumps([source]),
+                         pack_signature(signature) if signature else None, now, now))
+                    contact_id = cursor.lastrowid
+                else:
+                    row = conn.execute('SELECT * FROM contacts WHERE id = ?', (contact_id,)).fetchone()
+                    merged = {
+                        'name': row['name'] or contact['name'],
+                        'org': row['org'] or contact['org'],
+                        'title': row['title'] or contact['title'],
+                        'phones': merge_values(json.loads(row['phones']), contact['phones'], normalize_phone),
+                        'emails': merge_values(json.loads(row['emails']), contact['emails'], normalize_email),
+                        'webs': merge_values(json.loads(row['webs']), contact['webs'], normalize_web),
+                    }
+                    signature = minhash(merged)
+                    conn.execute(
+                        'UPDATE contacts SET name = ?, org = ?, title = ?, phones = ?, emails = ?, '
+                        'webs = ?, sources = ?, signature = ?, scans = scans + 1, updated = ? WHERE id = ?',
+                        (merged['name'], merged['org'], merged['title'],
+                         json.dumps(merged['phones']), json.dumps(merged['emails']),
+                         json.dumps(merged['webs']),
+                         json.dumps(merge_values(json.loads(row['sources']), [source])),
+                         pack_signature(signature) if signature else None, now, contact_id))
+                    keys = contact_keys(merged)
+                index_contact(conn, contact_id, keys, signature)
+        finally:
+            conn.close()
+
+    return {'contact_id': contact_id, 'matched': match_type is not None, 'match_type': match_type}
+
+
+def record_scan(results, source):
+    """add_scan for the request handlers: storage errors never fail a scan"""
+    try:
+        return add_scan(results, source)
+    except Exception as e:
+        print(f"Error storing contact: {str(e)}")
+        return None
+
+
+# --- export ----------------------------------------------------------------
+
+def iter_contacts(db_path=None, batch_size=500):
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute('SELECT id, name, org, title, phones, emails, webs, sources, scans, '
+                              'created, updated FROM contacts ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                contact = dict(row)
+                for field in ('phones', 'emails', 'webs', 'sources'):
+                    contact[field] = json.loads(contact[field])
+                yield contact
+    finally:
+        conn.close()
+
+
+def export_jsonl(contacts):
+    for contact in contacts:
+        yield json.dumps(contact) + "\n"
+
+
+def export_csv(contacts):
+    fields = ['id', 'name', 'org', 'title', 'phones', 'emails', 'webs', 'sources', 'scans']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for contact in contacts:
+        writer.writerow([";".join(map(str, contact[f])) if isinstance(contact[f], list) else contact[f]
+                         for f in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # header only when the store is empty
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def vcard_escape(value):
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;').replace('\n', '\\n')
+
+
+def vcard_name(name):
+    # N is family;given;additional;prefix;suffix. Card names are printed
+    # given name first, so the last word is taken as the family name.
+    words = str(name).split()
+    return vcard_escape(words[-1]) + ";" + vcard_escape(" ".join(words[:-1])) + ";;;"
+
+
+def export_vcard(contacts):
+    for contact in contacts:
+        lines = ["BEGIN:VCARD", "VERSION:3.0",
+                 "FN:" + vcard_escape(contact['name'] or contact['org'] or 'Unknown')]
+        if contact['name'] and contact['name'].strip():
+            lines.append("N:" + vcard_name(contact['name']))
+        if contact['org']:
+            lines.append("ORG:" + vcard_escape(contact['org']))
+        if contact['title']:
+            lines.append("TITLE:" + vcard_escape(contact['title']))
+        lines += ["TEL:" + vcard_escape(p) for p in contact['phones']]
+        lines += ["EMAIL:" + vcard_escape(e) for e in contact['emails']]
+        lines += ["URL:" + vcard_escape(w) for w in contact['webs']]
+        lines.append("END:VCARD")
+        yield "\r\n".join(lines) + "\r\n"
+
+
+EXPORTERS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson', 'contacts.jsonl'),
+    'csv': (export_csv, 'text/csv', 'contacts.csv'),
+    'vcf': (export_vcard, 'text/vcard', 'contacts.vcf'),
+}
@@ -0,0 +1,180 @@
+import re
+
+LABELS = ('NAME', 'ORG', 'DES', 'PHONE', 'EMAIL', 'WEB')
+# labels whose words are joined with a space; the others are concatenated
+SPACED_LABELS = ('NAME', 'ORG', 'DES')
+
+# compiled once instead of per token; same character classes as before
+NORMALIZERS = {
+    'PHONE': (re.compile(r'\D'), False),
+    'EMAIL': (re.compile(r'[^A-Za-z0-9@_.\- ]'), False),
+    'WEB': (re.compile(r'[^A-Za-z0-9:/.%#\- ]'), False),
+    'NAME': (re.compile(r'[^a-z ]'), True),
+    'DES': (re.compile(r'[^a-z ]'), True),
+    'ORG': (re.compile(r'[^a-z0-9 ]'), True),
+}
+
+
+def normalize(text, label):
+    """Clean a token's text for the given entity label"""
+    if label not in NORMALIZERS:
+        return text
+    pattern, title = NORMALIZERS[label]
+    text = pattern.sub('', text.lower())
+    return text.title() if title else text
+
+
+def word_labels(doc, word_starts):
+    """
+    Label every OCR word from the spaCy doc.
+
+    Only words that start on a token boundary are kept, and a word carries
+    the label of the entity span starting at that token (``O`` otherwise).
+
+    Returns:
+        list: (word index, token text, BIO label) for each kept word
+    """
+    tokens = {token.idx: token.text for token in doc}
+    ent_labels = {ent.start_char: ent.label_ for ent in doc.ents}
+
+    labelled = []
+    for index, start in enumerate(word_starts):
+        if start in tokens:
+            labelled.append((index, tokens[start], ent_labels.get(start, 'O')))
+    return labelled
+
+
+def assemble(labelled):
+    """
+    Build the NAME/ORG/DES/PHONE/EMAIL/WEB dict from labelled words.
+    A ``B`` tag opens a new value; an ``I`` tag extends the previous value
+    when the previous word had the same label and opens one otherwise.
+    """
+    entities = {label: [] for label in LABELS}
+    previous = 'O'
+
+    for _, token, label in labelled:
+        bio_tag = label[0]
+        label_tag = label[2:]
+
+        if bio_tag in ('B', 'I') and label_tag in entities:
+            text = normalize(token, label_tag)
+            values = entities[label_tag]
+            if bio_tag == 'B' or previous != label_tag:
+                values.append(text)
+            elif label_tag in SPACED_LABELS:
+                values[-1] = values[-1] + " " + text
+            else:
+                values[-1] = values[-1] + text
+        previous = label_tag
+
+    return entities
+
+
+def group_boxes(labelled, boxes, confs=None):
+    """
+    Merge the boxes of consecutive entity words with the same label.
+
+    Args:
+        labelled (list): output of word_labels
+        boxes (list): (left, top, width, height) of every OCR word
+        confs (list): optional Tesseract confidence (0-100) of every word
+
+    Returns:
+        list: dicts with label, text, left/top/right/bottom and the mean
+              word confidence (None without confs)
+    """
+    groups = []
+    for index, token, label in labelled:
+        if label == 'O':
+            continue
+        left, top, width, height = boxes[index]
+        conf = confs[index] if confs is not None else None
+        label_tag = label[2:]
+        if groups and groups[-1]['label'] == label_tag:
+            group = groups[-1]
+            group['left'] = min(group['left'], left)
+            group['top'] = min(group['top'], top)
+            group['right'] = max(group['right'], left + width)
+            group['bottom'] = max(group['bottom'], top + height)
+            group['text'] = group['text'] + " " + token
+            group['confs'].append(conf)
+        else:
+            groups.append({'label': label_tag, 'text': token,
+                           'left': left, 'top': top,
+                           'right': left + width, 'bottom': top + height,
+                           'confs': [conf]})
+
+    for group in groups:
+        valid = [c for c in group.pop('confs') if c is not None and c >= 0]
+        group['confidence'] = round(sum(valid) / len(valid), 1) if valid else None
+    return groups
+
+
+def word_offsets(words):
+    # start offsets of the words in " ".join(words)
+    starts = []
+    offset = 0
+    for word in words:
+        starts.append(offset)
+        offset += len(word) + 1
+    return starts
+
+
+def decode(doc, words, boxes, confs=None):
+    """
+    Turn a spaCy doc over " ".join(words) into entities and grouped boxes.
+    No state is kept between calls, so this is safe to use from threads.
+
+    Returns:
+        tuple: (entities dict, groups list, number of entity words) or
+               (error dict, [], 0)
+    """
+    if len(doc) == 0:
+        return {"ERROR": "No text detected in the image"}, [], 0
+    if len(doc.ents) == 0:
+        return {"ERROR": "No entities detected in the image"}, [], 0
+
+    labelled = word_labels(doc, word_offsets(words))
+    groups = group_boxes(labelled, boxes, confs)
+    if not groups:
+        return {"ERROR": "No entities with bounding boxes detected"}, [], 0
+
+    entity_words = sum(1 for _, _, label in labelled if label != 'O')
+    return assemble(labelled), groups, entity_words
+
+
+def decode_batch(nlp, documents, batch_size=32):
+    """
+    Run the NER model over many OCR results at once with nlp.pipe.
+
+    Args:
+        nlp: spaCy pipeline
+        documents (list): (words, boxes, confs) per document
+
+    Returns:
+        list: decode() output per document
+    """
+    texts = (" ".join(words) for words, _, _ in documents)
+    return [decode(doc, words, boxes, confs)
+            for doc, (words, boxes, confs) in zip(nlp.pipe(texts, batch_size=batch_size), documents)]
+
+
+def to_overlay(groups, width, height):
+    """
+    Vector description of the detected fields for client-side drawing:
+    one polygon (clockwise from top-left) per grouped entity box.
+    """
+    return {
+        'width': int(width),
+        'height': int(height),
+        'boxes': [{
+            'label': group['label'],
+            'text': group['text'],
+            'confidence': group['confidence'],
+            'polygon': [[int(group['left']), int(group['top'])],
+                        [int(group['right']), int(group['top'])],
+                        [int(group['right']), int(group['bottom'])],
+                        [int(group['left']), int(group['bottom'])]],
+        } for group in groups],
+    }
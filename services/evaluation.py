@@ -0,0 +1,292 @@
+"""
+Offline accuracy vs latency evaluation of the extraction backends.
+
+Ground truth is a JSON file mapping image file names (relative to the
+ground truth file) to the expected entities, e.g.::
+
+    {
+      "001.jpg": {"NAME": ["Liam Butler"], "ORG": ["IBM United Kingdom Limited"],
+                  "DES": [], "PHONE": ["+44 (0)207 202 3261"],
+                  "EMAIL": ["liambutler@uk.ibm.com"], "WEB": []}
+    }
+
+Usage::
+
+    python -m services.evaluation test/ground_truth.json \\
+        --configs pytesseract:best pytesseract:last qwen2 --min-f1 0.7
+"""
+import argparse
+import importlib
+import json
+import os
+import re
+import resource
+import time
+from collections import Counter
+
+import utils.utils as utils
+import utils.orientation as orientation
+import utils.ingest as ingest
+import services.predictions as pred
+import services.azureform as azureform
+import services.contacts as contacts
+from services.entities import LABELS
+from services.model_manager import manager, process_rss_mb
+
+DEFAULT_CONFIGS = ['pytesseract:best', 'pytesseract:last']
+
+
+def normalize_value(value, label):
+    """Canonical form used to compare a predicted value with ground truth"""
+    value = str(value).strip().lower()
+    if label == 'PHONE':
+        return re.sub(r'\D', '', value)[-10:]
+    if label == 'EMAIL':
+        return re.sub(r'\s', '', value)
+    if label == 'WEB':
+        value = re.sub(r'^[a-z]+://', '', re.sub(r'\s', '', value))
+        return re.sub(r'^www\.', '', value).rstrip('/')
+    return " ".join(re.sub(r'[^a-z0-9 ]', ' ', value).split())
+
+
+def to_labels(results):
+    """Bring the output of any backend to NAME/ORG/DES/PHONE/EMAIL/WEB lists"""
+    if 'entities' in results:
+        contact = contacts.to_contact(results)
+        return {
+            'NAME': [contact['name']] if contact['name'] else [],
+            'ORG': contacts.as_list(results['entities'].get('company')),
+            'DES': contacts.as_list(results['entities'].get('jobTitle')),
+            'PHONE': contact['phones'],
+            'EMAIL': contact['emails'],
+            'WEB': contact['webs'],
+        }
+    return {label: contacts.as_list(results.get(label)) for label in LABELS}
+
+
+def match_counts(predicted, expected):
+    """
+    True positives, false positives and false negatives per label, treating
+    each label's values as a multiset of normalised strings.
+    """
+    counts = {}
+    for label in LABELS:
+        pred = Counter(v for v in (normalize_value(x, label) for x in predicted.get(label, [])) if v)
+        gold = Counter(v for v in (normalize_value(x, label) for x in expected.get(label, [])) if v)
+        tp = sum((pred & gold).values())
+        counts[label] = {'tp': tp,
+                         'fp': sum(pred.values()) - tp,
+                         'fn': sum(gold.values()) - tp}
+    return counts
+
+
+def prf(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4)}
+
+
+def prepare_sample(image_path):
+    """
+    Same preprocessing as the web flow: the upload is decoded in memory and
+    the card is located, warped and rotated for Pytesseract, while Qwen2
+    and Azure get the original upload.
+
+    Returns:
+        tuple: (card image, decoded upload, ingest info of the upload)
+    """
+    with open(image_path, 'rb') as f:
+        image, upload = ingest.decode_image(f.read())
+    docscan = utils.DocumentScan()
+    four_points, size = docscan.document_scanner_image(image)
+    if four_points is None:
+        card = image
+    else:
+        card = docscan.calibrate_to_original_size(four_points)
+    card, angle, method = orientation.normalize_orientation(card)
+    return card, image, upload
+
+
+def make_runner(config):
+    """
+    Returns:
+        tuple: (callable taking (card image, decoded upload, upload info) and
+               returning the entity dict, model manager name or None)
+    """
+    backend, _, variant = config.partition(':')
+    if backend == 'pytesseract':
+        variant = variant or 'best'
+        return (lambda card, image, upload: pred.getPredictions(card, variant=variant)[1]), 'ner-' + variant
+    if backend == 'qwen2':
+        # imported here: it pulls in torch
+        qwenform = importlib.import_module('services.qwenform')
+        result = qwenform.load_qwen_model()
+        if result['status'] != 'success':
+            raise RuntimeError(result['message'])
+        return (lambda card, image, upload: qwenform.process_array(image)), 'qwen2'
+    if backend == 'azure':
+        def run_azure(card, image, upload):
+            return azureform.process_business_card_bytes(ingest.encode_upload(upload, image))
+        return run_azure, None
+    raise ValueError(f"Unknown configuration {config}")
+
+
+def evaluate_config(config, samples):
+    """
+    Run one backend configuration over all samples.
+
+    Args:
+        config (str): backend[:variant], e.g. pytesseract:last
+        samples (list): (image path, warped card, decoded upload, upload
+            info, expected entities)
+
+    Returns:
+        dict: per-label and micro precision/recall/F1, latency and memory
+    """
+    runner, model_name = make_runner(config)
+    rss_before = process_rss_mb()
+    if model_name is not None:
+        # load outside the timed loop; loading cost is reported separately
+        manager.get(model_name)
+
+    totals = {label: Counter() for label in LABELS}
+    latencies = []
+    errors = 0
+    for image_path, card, image, upload, expected in samples:
+        start = time.perf_counter()
+        results = runner(card, image, upload)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if "ERROR" in results or "error" in results:
+            errors += 1
+        for label, counts in match_counts(to_labels(results), expected).items():
+            totals[label].update(counts)
+
+    per_label = {label: prf(c['tp'], c['fp'], c['fn']) for label, c in totals.items()}
+    micro = Counter()
+    for c in totals.values():
+        micro.update(c)
+
+    latencies.sort()
+    model_stats = manager.stats()['models'].get(model_name, {}) if model_name else {}
+    rss_after = process_rss_mb()
+    return {
+        'config': config,
+        'cards': len(samples),
+        'errors': errors,
+        'per_label': per_label,
+        'micro': prf(micro['tp'], micro['fp'], micro['fn']),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 1) if latencies else None,
+            'p50': round(latencies[len(latencies) // 2], 1) if latencies else None,
+            'p95': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 1) if latencies else None,
+        },
+        'model_load_seconds': model_stats.get('load_seconds'),
+        'model_mb': model_stats.get('size_mb'),
+        'rss_growth_mb': None if rss_before is None or rss_after is None else round(rss_after - rss_before, 1),
+    }
+
+
+def pareto_front(reports):
+    """Configurations not beaten on both mean latency and micro F1"""
+    front = []
+    for r in reports:
+        lat, f1 = r['latency_ms']['mean'], r['micro']['f1']
+        dominated = any(
+            o is not r and o['latency_ms']['mean'] <= lat and o['micro']['f1'] >= f1 and
+            (o['latency_ms']['mean'] < lat or o['micro']['f1'] > f1)
+            for o in reports)
+        if not dominated:
+            front.append(r['config'])
+    return front
+
+
+def recommend(reports, min_f1):
+    """Cheapest configuration whose micro F1 reaches the accuracy bar"""
+    eligible = [r for r in reports if r['micro']['f1'] >= min_f1]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: r['latency_ms']['mean'])['config']
+
+
+def load_samples(ground_truth_path):
+    with open(ground_truth_path) as f:
+        ground_truth = json.load(f)
+    image_dir = os.path.dirname(os.path.abspath(ground_truth_path))
+
+    samples = []
+    for filename, expected in ground_truth.items():
+        image_path = os.path.join(image_dir, filename)
+        if not os.path.exists(image_path):
+            print(f"Skipping {filename}: image not found")
+            continue
+        try:
+            card, image, upload = prepare_sample(image_path)
+        except ingest.UploadRejected as e:
+            print(f"Skipping {filename}: {e.message}")
+            continue
+        samples.append((image_path, card, image, upload, expected))
+    return samples
+
+
+def run(ground_truth_path, configs, min_f1):
+    samples = load_samples(ground_truth_path)
+    if not samples:
+        # nothing to time or score, the rankings below would be meaningless
+        raise ValueError(f"No usable images found for {ground_truth_path}")
+    reports = []
+    for config in configs:
+        print(f"Evaluating {config} on {len(samples)} cards...")
+        try:
+            reports.append(evaluate_config(config, samples))
+        except Exception as e:
+            print(f"Skipping {config}: {str(e)}")
+
+    return {
+        'reports': reports,
+        'pareto_front': pareto_front(reports),
+        'min_f1': min_f1,
+        'recommended': recommend(reports, min_f1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def print_summary(summary):
+    header = f"{'config':<20}{'F1':>7}{'P':>7}{'R':>7}{'mean ms':>10}{'p95 ms':>10}{'model MB':>10}{'errors':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in summary['reports']:
+        print(f"{r['config']:<20}{r['micro']['f1']:>7.3f}{r['micro']['precision']:>7.3f}"
+              f"{r['micro']['recall']:>7.3f}{r['latency_ms']['mean'] or 0:>10.1f}"
+              f"{r['latency_ms']['p95'] or 0:>10.1f}{r['model_mb'] or 0:>10.1f}{r['errors']:>8}")
+    print()
+    for r in summary['reports']:
+        labels = "  ".join(f"{label} {scores['f1']:.2f}" for label, scores in r['per_label'].items())
+        print(f"{r['config']:<20}{labels}")
+    print()
+    print(f"Pareto front (latency vs F1): {', '.join(summary['pareto_front']) or '-'}")
+    print(f"Cheapest config with F1 >= {summary['min_f1']}: {summary['recommended'] or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate extraction accuracy against latency')
+    parser.add_argument('ground_truth', help='JSON file mapping image names to expected entities')
+    parser.add_argument('--configs', nargs='+', default=DEFAULT_CONFIGS,
+                        help='backend[:variant] list, e.g. pytesseract:best pytesseract:last qwen2 azure')
+    parser.add_argument('--min-f1', type=float, default=0.7, help='accuracy bar for the recommendation')
+    parser.add_argument('--output', help='write the full report as JSON')
+    args = parser.parse_args()
+
+    try:
+        summary = run(args.ground_truth, args.configs, args.min_f1)
+    except ValueError as e:
+        parser.error(str(e))
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
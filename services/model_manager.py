@@ -0,0 +1,258 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import config.settings as settings
+
+
+def process_rss_mb():
+    """Resident set size of this process in MB (Linux), None elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ModelEntry():
+    def __init__(self, name, loader, unloader=None, size_fn=None, vram_fn=None):
+        self.name = name
+        self.loader = loader
+        self.unloader = unloader
+        self.size_fn = size_fn
+        self.vram_fn = vram_fn
+        self.model = None
+        self.size_mb = None
+        self.vram_mb = None
+        self.last_used = None
+        # held while the model is loaded and while a lease is taken on it
+        self.load_lock = threading.Lock()
+        # running users of the model; evictions skip models in use
+        self.in_use = 0
+        # larger than the whole budget: never evicted to make room
+        self.pinned = False
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+        self.load_seconds = None
+
+
+class ModelManager():
+    """
+    Owns the heavy models of the app. Models are loaded on first use, kept
+    within a RAM budget by evicting the least recently used ones, dropped
+    after being idle for ``ttl`` seconds and reloaded transparently by the
+    next ``use`` or ``get``. A model is never evicted while a ``use`` lease
+    on it is held.
+    """
+
+    def __init__(self, budget_mb, ttl, interval):
+        self.budget_mb = budget_mb
+        self.ttl = ttl
+        self.interval = interval
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.janitor = None
+
+    def register(self, name, loader, unloader=None, size_fn=None, vram_fn=None):
+        """
+        Args:
+            name (str): model name
+            loader (callable): returns the loaded model
+            unloader (callable): optional cleanup called without arguments
+                once the manager dropped its reference to the model, e.g.
+                to empty the CUDA cache
+            size_fn (callable): optional, returns the host memory the model
+                takes in MB; the RSS growth during loading is used otherwise
+            vram_fn (callable): optional, returns the GPU memory the model
+                takes in MB (reported only, not part of the RAM budget)
+        """
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = ModelEntry(name, loader, unloader, size_fn, vram_fn)
+
+    def get(self, name):
+        """
+        Load the model if needed and return it without a lease, e.g. to
+        preload it. Code that runs the model should hold ``use`` instead.
+        """
+        entry = self.entries[name]
+        with entry.load_lock:
+            return self.acquire(entry)
+
+    @contextmanager
+    def use(self, name):
+        """Lease on a model: it is loaded if needed and stays resident until released"""
+        entry = self.entries[name]
+        with entry.load_lock:
+            model = self.acquire(entry)
+            with self.lock:
+                entry.in_use += 1
+        try:
+            yield model
+        finally:
+            with self.lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def acquire(self, entry):
+        # caller holds entry.load_lock
+        if entry.model is None:
+            self.load(entry)
+        else:
+            entry.hits += 1
+        entry.last_used = time.time()
+        return entry.model
+
+    def load(self, entry):
+        # make room using the size measured on a previous load, if any
+        if entry.size_mb and not entry.pinned:
+            self.make_room(entry.size_mb, keep=entry.name)
+
+        print(f"Loading model {entry.name}...")
+        rss_before = process_rss_mb()
+        start = time.perf_counter()
+        model = entry.loader()
+        entry.load_seconds = round(time.perf_counter() - start, 2)
+
+        if entry.size_fn is not None:
+            entry.size_mb = entry.size_fn(model)
+        else:
+            rss_after = process_rss_mb()
+            if rss_before is not None and rss_after is not None:
+                entry.size_mb = max(rss_after - rss_before, 0.0)
+        if entry.vram_fn is not None:
+            entry.vram_mb = entry.vram_fn(model)
+
+        with self.lock:
+            entry.model = model
+            entry.loads += 1
+        print(f"Model {entry.name} loaded in {entry.load_seconds}s ({entry.size_mb or 0:.0f} MB)")
+
+        if (entry.size_mb or 0) > self.budget_mb:
+            # evicting it would only make the next request reload it
+            entry.pinned = True
+            print(f"Model {entry.name} ({entry.size_mb:.0f} MB) is larger than the model budget "
+                  f"of {self.budget_mb} MB on its own; keeping it resident")
+        else:
+            self.make_room(0, keep=entry.name)
+        self.start_janitor()
+
+    def resident_mb(self):
+        return sum(e.size_mb or 0 for e in self.entries.values() if e.model is not None)
+
+    def evictable(self, keep=None):
+        return [e for e in self.entries.values()
+                if e.model is not None and e.name != keep and not e.pinned and not e.in_use]
+
+    def make_room(self, needed_mb, keep=None):
+        """
+        Evict least recently used models until needed_mb fits the budget.
+        Nothing is evicted when the budget can't be met even after evicting
+        every model that is not pinned or in use.
+        """
+        if self.resident_mb() + needed_mb <= self.budget_mb:
+            return
+        freeable = sum(e.size_mb or 0 for e in self.evictable(keep))
+        if self.resident_mb() - freeable + needed_mb > self.budget_mb:
+            print(f"Model budget of {self.budget_mb} MB can't be met without evicting "
+                  f"models in use or pinned; keeping the resident models")
+            return
+        tried = set()
+        while self.resident_mb() + needed_mb > self.budget_mb:
+            # a candidate leased or being loaded meanwhile refuses to unload
+            candidates = [e for e in self.evictable(keep) if e.name not in tried]
+            if not candidates:
+                return
+            victim = min(candidates, key=lambda e: e.last_used or 0)
+            tried.add(victim.name)
+            self.unload(victim.name, reason='budget')
+
+    def unload(self, name, reason='manual'):
+        """Drop a model unless it is being loaded or used right now"""
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        if not entry.load_lock.acquire(blocking=False):
+            return False
+        try:
+            with self.lock:
+                if entry.in_use:
+                    return False
+                model, entry.model = entry.model, None
+        finally:
+            entry.load_lock.release()
+        if model is None:
+            return False
+
+        entry.evictions += 1
+        entry.pinned = False
+        # release the weights before the unloader empties any caches
+        del model
+        gc.collect()
+        if entry.unloader is not None:
+            try:
+                entry.unloader()
+            except Exception as e:
+                print(f"Error unloading model {name}: {str(e)}")
+        print(f"Unloaded model {name} ({reason})")
+        return True
+
+    def evict_idle(self):
+        now = time.time()
+        for entry in list(self.entries.values()):
+            if entry.model is not None and not entry.in_use and entry.last_used is not None and \
+                    now - entry.last_used > self.ttl:
+                self.unload(entry.name, reason='idle')
+
+    def start_janitor(self):
+        with self.lock:
+            if self.janitor is not None:
+                return
+            self.janitor = threading.Thread(target=self.janitor_loop, daemon=True)
+            self.janitor.start()
+
+    def janitor_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"Error evicting idle models: {str(e)}")
+
+    def is_loaded(self, name):
+        entry = self.entries.get(name)
+        return entry is not None and entry.model is not None
+
+    def stats(self):
+        now = time.time()
+        models = {}
+        for name, entry in self.entries.items():
+            models[name] = {
+                'loaded': entry.model is not None,
+                'size_mb': None if entry.size_mb is None else round(entry.size_mb, 1),
+                'vram_mb': None if entry.vram_mb is None else round(entry.vram_mb, 1),
+                'in_use': entry.in_use,
+                'pinned': entry.pinned,
+                'loads': entry.loads,
+                'evictions': entry.evictions,
+                'hits': entry.hits,
+                'load_seconds': entry.load_seconds,
+                'idle_seconds': None if entry.last_used is None else round(now - entry.last_used, 1),
+            }
+        rss = process_rss_mb()
+        return {
+            'budget_mb': self.budget_mb,
+            'resident_mb': round(self.resident_mb(), 1),
+            'process_rss_mb': None if rss is None else round(rss, 1),
+            'idle_ttl': self.ttl,
+            'models': models,
+        }
+
+
+manager = ModelManager(settings.MODEL_RAM_BUDGET_MB,
+                       settings.MODEL_IDLE_TTL,
+                       settings.MODEL_EVICTION_INTERVAL)
@@ -14,9 +14,32 @@ warnings.filterwarnings('ignore')
 import json
 
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 
-### Load NER model
-model_ner = spacy.load('./models/model-best/')
+import config.settings as settings
+import services.entities as entities_decoder
+from services.model_manager import manager
+from services import slim_model
+
+
+def load_ner(model_path):
+    """Load a NER pipeline, memory-mapping its weights if it was slimmed"""
+    if slim_model.is_slim(model_path):
+        return slim_model.load(model_path)
+    return spacy.load(model_path)
+
+
+### NER models are loaded on first use and owned by the model manager
+for variant, model_path in settings.NER_MODEL_PATHS.items():
+    manager.register('ner-' + variant, lambda model_path=model_path: load_ner(model_path))
+
+
+def use_ner(variant=None):
+    """
+    Lease on the spaCy NER pipeline ('best', 'last' or 'slim'), loading it
+    if needed; it can't be evicted while the lease is held
+    """
+    return manager.use('ner-' + (variant or settings.NER_MODEL))
 
 
 def cleanText(txt):
@@ -31,184 +54,141 @@ def cleanText(txt):
     
     return str(removepunctuation)
 
-# group the label
-class groupgen():
-    def __init__(self):
-        self.id = 0
-        self.text = ''
-        
-    def getgroup(self,text):
-        if self.text == text:
-            return self.id
-        else:
-            self.id +=1
-            self.text = text
-            return self.id
-        
+def ocr_words(image):
+    """
+    Run Pytesseract on the image and return the cleaned, non-empty words
+    with their boxes (left, top, width, height) and Tesseract confidences.
+    """
+    tessData = pytesseract.image_to_data(image)
+    # convert into dataframe
+    tessList = list(map(lambda x:x.split('\t'), tessData.split('\n')))
+    df = pd.DataFrame(tessList[1:],columns=tessList[0])
+    df.dropna(inplace=True) # drop missing values
+    df['text'] = df['text'].apply(cleanText)
 
+    df_clean = df.query('text != "" ')
+    words = list(df_clean['text'])
+    boxes = [tuple(box) for box in df_clean[['left','top','width','height']].astype(int).values]
+    confs = list(pd.to_numeric(df_clean['conf'], errors='coerce').fillna(-1).astype(float))
 
-def parser(text,label):
-    if label == 'PHONE':
-        text = text.lower()
-        text = re.sub(r'\D','',text)
-        
-    elif label == 'EMAIL':
-        text = text.lower()
-        allow_special_char = '@_.\-'
-        text = re.sub(r'[^A-Za-z0-9{} ]'.format(allow_special_char),'',text)
-        
-    elif label == 'WEB':
-        text = text.lower()
-        allow_special_char = ':/.%#\-'
-        text = re.sub(r'[^A-Za-z0-9{} ]'.format(allow_special_char),'',text)
-        
-    elif label in ('NAME', 'DES'):
-        text = text.lower()
-        text = re.sub(r'[^a-z ]','',text)
-        text = text.title()
-        
-    elif label == 'ORG':
-        text = text.lower()
-        text = re.sub(r'[^a-z0-9 ]','',text)
-        text = text.title()
-        
-    return text
+    return words, boxes, confs
 
 
+def mean_conf(confs):
+    valid = [c for c in confs if c >= 0]
+    return float(np.mean(valid)) if valid else 0.0
 
-grp_gen = groupgen()
 
-def getPredictions(image):
-    try:
-        # extract data using Pytesseract 
-        tessData = pytesseract.image_to_data(image)
-        # convert into dataframe
-        tessList = list(map(lambda x:x.split('\t'), tessData.split('\n')))
-        df = pd.DataFrame(tessList[1:],columns=tessList[0])
-        df.dropna(inplace=True) # drop missing values
-        df['text'] = df['text'].apply(cleanText)
-
-        # convet data into content
-        df_clean = df.query('text != "" ')
-        content = " ".join([w for w in df_clean['text']])
-        print(content)
-        # get prediction from NER model
-        doc = model_ner(content)
+def render_overlay(image, overlay):
+    """
+    Draw the overlay boxes and labels on a copy of the image. Only used when
+    a server-rendered bounding box image is explicitly requested.
+    """
+    img_bb = image.copy()
+    for box in overlay['boxes']:
+        (l, t), _, (r, b), _ = box['polygon']
+        cv2.rectangle(img_bb,(l,t),(r,b),(0,255,0),2)
+        cv2.putText(img_bb, box['label'], (l,t), cv2.FONT_HERSHEY_PLAIN, 1, (255,0,255), 2)
+    return img_bb
 
-        # converting doc in json
-        docjson = doc.to_json()
-        doc_text = docjson['text']
 
-        # creating tokens
-        datafram_tokens = pd.DataFrame(docjson['tokens'])
-        
-        # Check if there are any tokens
-        if len(datafram_tokens) == 0:
-            return image.copy(), {"ERROR": "No text detected in the image"}
+def empty_overlay(image):
+    h, w = image.shape[:2]
+    return entities_decoder.to_overlay([], w, h)
 
-        datafram_tokens['token'] = datafram_tokens[['start','end']].apply(
-            lambda x:doc_text[x[0]:x[1]] , axis = 1)
 
-        # Check if there are any entities detected
-        if 'ents' not in docjson or len(docjson['ents']) == 0:
-            return image.copy(), {"ERROR": "No entities detected in the image"}
-            
-        # Safely create the right table with entities
-        try:
-            right_table = pd.DataFrame(docjson['ents'])[['start','label']]
-            datafram_tokens = pd.merge(datafram_tokens, right_table, how='left', on='start')
-            datafram_tokens.fillna('O', inplace=True)
-        except KeyError as e:
-            # Handle missing columns in ents dataframe
-            print(f"KeyError in entities processing: {str(e)}")
-            return image.copy(), {"ERROR": f"Missing data in entity extraction: {str(e)}"}
-
-        # join lable to df_clean dataframe
-        df_clean['end'] = df_clean['text'].apply(lambda x: len(x)+1).cumsum() - 1 
-        df_clean['start'] = df_clean[['text','end']].apply(lambda x: x[1] - len(x[0]),axis=1)
-
-        # inner join with start 
-        try:
-            dataframe_info = pd.merge(df_clean, datafram_tokens[['start','token','label']], how='inner', on='start')
-        except KeyError as e:
-            # Handle missing columns in tokens dataframe
-            print(f"KeyError in dataframe merge: {str(e)}")
-            return image.copy(), {"ERROR": f"Failed to merge data: {str(e)}"}
-
-        # Bounding Box
-        bb_df = dataframe_info.query("label != 'O' ")
-        
-        # If no entities with bounding boxes were found
-        if len(bb_df) == 0:
-            return image.copy(), {"ERROR": "No entities with bounding boxes detected"}
+def fill_stats(stats, words, confs, entity_words):
+    if stats is not None:
+        stats.update(ocr_conf=mean_conf(confs), words=len(words), entity_words=entity_words)
 
-        bb_df['label'] = bb_df['label'].apply(lambda x: x[2:])
-        bb_df['group'] = bb_df['label'].apply(grp_gen.getgroup)
 
-        # right and bottom of bounding box
-        try:
-            bb_df[['left','top','width','height']] = bb_df[['left','top','width','height']].astype(int)
-            bb_df['right'] = bb_df['left'] + bb_df['width']
-            bb_df['bottom'] = bb_df['top'] + bb_df['height']
-        except KeyError as e:
-            # Handle missing columns in bb_df
-            print(f"KeyError in bounding box processing: {str(e)}")
-            return image.copy(), {"ERROR": f"Missing bounding box data: {str(e)}"}
-
-        # tagging: groupby group
-        col_group = ['left','top','right','bottom','label','token','group']
-        group_tag_img = bb_df[col_group].groupby(by='group')
-        img_tagging = group_tag_img.agg({
-            'left':min,
-            'right':max,
-            'top':min,
-            'bottom':max,
-            'label':np.unique,
-            'token':lambda x: " ".join(x)
-        })
-
-        img_bb = image.copy()
-        for l,r,t,b,label,token in img_tagging.values:
-            cv2.rectangle(img_bb,(l,t),(r,b),(0,255,0),2)
-            # Convert label to string and ensure it's not None
-            label_str = str(label) if label is not None else ""
-            cv2.putText(img_bb, label_str, (l,t), cv2.FONT_HERSHEY_PLAIN, 1, (255,0,255), 2)
-
-        # Entities
-        info_array = dataframe_info[['token','label']].values
-        entities = dict(NAME=[],ORG=[],DES=[],PHONE=[],EMAIL=[],WEB=[])
-        previous = 'O'
-
-        for token, label in info_array:
-            bio_tag = label[0]
-            label_tag = label[2:]
-
-            # step -1 parse the token
-            text = parser(token,label_tag)
-
-            if bio_tag in ('B','I'):
-                if previous != label_tag:
-                    entities[label_tag].append(text)
-                else:
-                    if bio_tag == "B":
-                        entities[label_tag].append(text)
-                    else:
-                        if label_tag in ("NAME",'ORG','DES'):
-                            entities[label_tag][-1] = entities[label_tag][-1] + " " + text
-                        else:
-                            entities[label_tag][-1] = entities[label_tag][-1] + text
-            previous = label_tag
-            
-        return img_bb, entities
-        
+def getPredictions(image, stats=None, variant=None):
+    """
+    Run Pytesseract OCR and the spaCy NER model on a warped card image.
+
+    Returns the entity boxes as a vector overlay (see
+    services.entities.to_overlay) together with the entities; use
+    render_overlay to draw them onto the image when a picture is needed.
+
+    If a ``stats`` dict is given it is filled with the OCR statistics the
+    cascade needs to score the result: mean Tesseract word confidence
+    (``ocr_conf``, 0-100), number of recognised words (``words``) and the
+    number of those words tagged with an entity (``entity_words``).
+
+    ``variant`` selects the NER model ('best' or 'last', default from
+    settings.NER_MODEL).
+    """
+    if stats is not None:
+        stats.update(ocr_conf=0.0, words=0, entity_words=0)
+    try:
+        words, boxes, confs = ocr_words(image)
+        content = " ".join(words)
+        print(content)
+
+        # get prediction from NER model
+        with use_ner(variant) as nlp:
+            doc = nlp(content)
+        entities, groups, entity_words = entities_decoder.decode(doc, words, boxes, confs)
+        fill_stats(stats, words, confs, entity_words)
+
+        h, w = image.shape[:2]
+        return entities_decoder.to_overlay(groups, w, h), entities
+
     except KeyError as e:
-        # Catch any other KeyError that might occur
         print(f"KeyError in getPredictions: {str(e)}")
-        return image.copy(), {"ERROR": f"Data extraction error: {str(e)}"}
+        return empty_overlay(image), {"ERROR": f"Data extraction error: {str(e)}"}
     except Exception as e:
         # Catch any other exceptions
         print(f"Exception in getPredictions: {str(e)}")
-        return image.copy(), {"ERROR": f"Processing error: {str(e)}"}
+        return empty_overlay(image), {"ERROR": f"Processing error: {str(e)}"}
+
+
+def getPredictionsBatch(images, stats=None, workers=4, variant=None):
+    """
+    Batched version of getPredictions: Tesseract runs on a thread pool and
+    the NER model processes all documents in one nlp.pipe call.
+
+    Args:
+        images (list): warped card images
+        stats (list): optional list that receives one stats dict per image
+
+    Returns:
+        list: (overlay, entities) per image
+    """
+    def safe_ocr(image):
+        try:
+            return ocr_words(image)
+        except Exception as e:
+            print(f"Exception in Pytesseract OCR: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        ocr_results = list(executor.map(safe_ocr, images))
+
+    valid = [i for i, ocr in enumerate(ocr_results) if ocr is not None]
+    documents = [ocr_results[i] for i in valid]
+    try:
+        with use_ner(variant) as nlp:
+            decoded = dict(zip(valid, entities_decoder.decode_batch(nlp, documents)))
+    except Exception as e:
+        print(f"Exception in getPredictionsBatch: {str(e)}")
+        decoded = {i: ({"ERROR": f"Processing error: {str(e)}"}, [], 0) for i in valid}
+
+    outputs = []
+    for i, image in enumerate(images):
+        item_stats = {'ocr_conf': 0.0, 'words': 0, 'entity_words': 0}
+        if i not in decoded:
+            outputs.append((empty_overlay(image), {"ERROR": "Processing error: OCR failed"}))
+        else:
+            entities, groups, entity_words = decoded[i]
+            words, _, confs = ocr_results[i]
+            fill_stats(item_stats, words, confs, entity_words)
+            h, w = image.shape[:2]
+            outputs.append((entities_decoder.to_overlay(groups, w, h), entities))
+        if stats is not None:
+            stats.append(item_stats)
+
+    return outputs
 
 
 def extract_json_response(input_text):
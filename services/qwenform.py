@@ -2,81 +2,137 @@ import torch
 from PIL import Image
 from transformers import AutoModelForVision2Seq, AutoProcessor
 import json
-import os
 import cv2
+import threading
 import config.settings as settings
+from services.model_manager import manager
 
-# Initialize model variables as None
-qwen_model = None
-qwen_processor = None
+# set once the user asked for Qwen2; the model manager may evict the weights
+# while idle and reloads them on the next request
+qwen_enabled = False
+# a single model instance can't run concurrent generate() calls
+qwen_lock = threading.Lock()
+
+def _load_model():
+    """
+    Load the Qwen2 model and processor
+    """
+    # Define model path
+    model_path = "models/Qwen2-VL-2B-OCR-fp16"
+    
+    # Load processor
+    print("Loading processor...")
+    processor = AutoProcessor.from_pretrained(
+        model_path, 
+        size={"shortest_edge": 56 * 56, "longest_edge": 28 * 28 * 1280}
+    )
+    
+    # Load model
+    print("Loading model...")
+    model = AutoModelForVision2Seq.from_pretrained(
+        model_path,
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+        device_map="auto",
+        trust_remote_code=True
+    )
+    return model, processor
+
+def _unload_model():
+    # called once the manager released the weights, so the cache is free
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _parameters_mb(loaded, on_gpu):
+    model, processor = loaded
+    return sum(p.numel() * p.element_size() for p in model.parameters()
+               if (p.device.type == 'cuda') == on_gpu) / (1024 * 1024)
+
+def _model_size_mb(loaded):
+    # only host memory counts against the RAM budget
+    return _parameters_mb(loaded, on_gpu=False)
+
+def _model_vram_mb(loaded):
+    return _parameters_mb(loaded, on_gpu=True)
+
+manager.register('qwen2', _load_model, unloader=_unload_model,
+                 size_fn=_model_size_mb, vram_fn=_model_vram_mb)
+
+def is_available():
+    return qwen_enabled
 
 def load_qwen_model():
     """
     Load the Qwen2 model and processor if not already loaded
     """
-    global qwen_model, qwen_processor
+    global qwen_enabled
     
     try:
-        if qwen_model is None or qwen_processor is None:
-            # Set device
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            
-            # Define model path
-            model_path = "models/Qwen2-VL-2B-OCR-fp16"
-            
-            # Load processor
-            print("Loading processor...")
-            qwen_processor = AutoProcessor.from_pretrained(
-                model_path, 
-                size={"shortest_edge": 56 * 56, "longest_edge": 28 * 28 * 1280}
-            )
-            
-            # Load model
-            print("Loading model...")
-            qwen_model = AutoModelForVision2Seq.from_pretrained(
-                model_path,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                device_map="auto",
-                trust_remote_code=True
-            )
-            
+        if not manager.is_loaded('qwen2'):
+            manager.get('qwen2')
+            qwen_enabled = True
             return {"status": "success", "message": "Model loaded successfully"}
         else:
+            qwen_enabled = True
             return {"status": "success", "message": "Model already loaded"}
     except Exception as e:
         print(f"Error loading model: {str(e)}")
         return {"status": "error", "message": f"Failed to load model: {str(e)}"}
 
-def process_document(image_path):
+def process_array(image):
     """
-    Process a document using the Qwen2 model
+    Process a BGR image already held in memory (e.g. one warped card)
     
     Args:
-        image_path (str): Path to the image file
+        image (numpy.ndarray): BGR image as returned by OpenCV
         
     Returns:
         dict: Extracted information from the document
     """
-    global qwen_model, qwen_processor
+    try:
+        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    except Exception as e:
+        return {"ERROR": f"Failed to process image: {str(e)}"}
+
+    return process_pil_image(pil_image)
+
+def process_pil_image(pil_image):
+    """
+    Run the Qwen2 entity extraction on a PIL image
     
+    Args:
+        pil_image (PIL.Image.Image): RGB image
+        
+    Returns:
+        dict: Extracted information from the document
+    """
     try:
         # Check if model is loaded
-        if qwen_model is None or qwen_processor is None:
+        if not qwen_enabled:
             return {"ERROR": "Qwen2 model not loaded. Please load the model first."}
-        
-        # Check if image exists
-        if not os.path.exists(image_path):
-            return {"ERROR": "Image file not found."}
-        
-        # Load and process image
+
+        # reloads transparently if the manager evicted it; the lease keeps
+        # it resident until generate() is done with it
+        # (_extract_entities reports its own errors, so anything raised here
+        # comes from loading the model)
         try:
-            pil_image = Image.open(image_path).convert("RGB")
-            pil_image = pil_image.resize((640, 640))
+            with manager.use('qwen2') as (qwen_model, qwen_processor):
+                return _extract_entities(qwen_model, qwen_processor, pil_image)
         except Exception as e:
-            return {"ERROR": f"Failed to process image: {str(e)}"}
-        
-        # Prompt for entity extraction
-        prompt_text = """Extract NAME, ORG, DES, PHONE, EMAIL, WEB from the image. Respond as JSON. Only use visible info.
+            return {"ERROR": f"Failed to load Qwen2 model: {str(e)}"}
+            
+    except Exception as e:
+        return {"ERROR": f"Unexpected error in document processing: {str(e)}"} 
+
+
+def _extract_entities(qwen_model, qwen_processor, pil_image):
+    """Prompt the loaded model for the card entities and parse its JSON answer"""
+    try:
+        pil_image = pil_image.resize((640, 640))
+    except Exception as e:
+        return {"ERROR": f"Failed to process image: {str(e)}"}
+    
+    # Prompt for entity extraction
+    prompt_text = """Extract NAME, ORG, DES, PHONE, EMAIL, WEB from the image. Respond as JSON. Only use visible info.
 {
   "NAME": [],
   "ORG": [],
@@ -85,73 +141,70 @@ def process_document(image_path):
   "EMAIL": [],
   "WEB": []
 }"""
+    
+    # Create conversation
+    conversation = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": pil_image},
+                {"type": "text", "text": prompt_text}
+            ]
+        }
+    ]
+    
+    # Process inputs
+    try:
+        prompt = qwen_processor.apply_chat_template(conversation, add_generation_prompt=True)
+        inputs = qwen_processor(
+            text=[prompt],
+            images=[pil_image],
+            padding=True,
+            return_tensors="pt"
+        ).to(qwen_model.device)
+    except Exception as e:
+        return {"ERROR": f"Failed to process model inputs: {str(e)}"}
+    
+    # Generate output
+    try:
+        with qwen_lock, torch.no_grad():
+            output_ids = qwen_model.generate(
+                **inputs,
+                max_new_tokens=512,
+                do_sample=False,
+                num_beams=1,
+                early_stopping=True
+            )
+        
+        # Decode output
+        generated_text = qwen_processor.batch_decode(output_ids, skip_special_tokens=True)[0]
+    except Exception as e:
+        return {"ERROR": f"Error in model generation: {str(e)}"}
+    
+    # Handle empty response
+    if not generated_text or len(generated_text.strip()) == 0:
+        return {"ERROR": "The AI model returned an empty response."}
+
+    # Extract JSON from response
+    try:
+        # Find JSON-like content in the response
+        start_idx = generated_text.find('{')
+        end_idx = generated_text.rfind('}') + 1
         
-        # Create conversation
-        conversation = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_image},
-                    {"type": "text", "text": prompt_text}
-                ]
-            }
-        ]
+        if start_idx == -1 or end_idx == 0:
+            return {"ERROR": "No valid JSON found in response"}
         
-        # Process inputs
-        try:
-            prompt = qwen_processor.apply_chat_template(conversation, add_generation_prompt=True)
-            inputs = qwen_processor(
-                text=[prompt],
-                images=[pil_image],
-                padding=True,
-                return_tensors="pt"
-            ).to(qwen_model.device)
-        except Exception as e:
-            return {"ERROR": f"Failed to process model inputs: {str(e)}"}
+        json_str = generated_text[start_idx:end_idx]
+        results = json.loads(json_str)
         
-        # Generate output
-        try:
-            with torch.no_grad():
-                output_ids = qwen_model.generate(
-                    **inputs,
-                    max_new_tokens=512,
-                    do_sample=False,
-                    num_beams=1,
-                    early_stopping=True
-                )
-            
-            # Decode output
-            generated_text = qwen_processor.batch_decode(output_ids, skip_special_tokens=True)[0]
-        except Exception as e:
-            return {"ERROR": f"Error in model generation: {str(e)}"}
+        # Ensure all required keys are present
+        for key in ["NAME", "ORG", "DES", "PHONE", "EMAIL", "WEB"]:
+            if key not in results:
+                results[key] = []
         
-        # Handle empty response
-        if not generated_text or len(generated_text.strip()) == 0:
-            return {"ERROR": "The AI model returned an empty response."}
-
-        # Extract JSON from response
-        try:
-            # Find JSON-like content in the response
-            start_idx = generated_text.find('{')
-            end_idx = generated_text.rfind('}') + 1
-            
-            if start_idx == -1 or end_idx == 0:
-                return {"ERROR": "No valid JSON found in response"}
-            
-            json_str = generated_text[start_idx:end_idx]
-            results = json.loads(json_str)
-            
-            # Ensure all required keys are present
-            for key in ["NAME", "ORG", "DES", "PHONE", "EMAIL", "WEB"]:
-                if key not in results:
-                    results[key] = []
-            
-            return results
-            
-        except json.JSONDecodeError as e:
-            return {"ERROR": f"Failed to parse JSON response: {str(e)}"}
-        except Exception as e:
-            return {"ERROR": f"Error processing model response: {str(e)}"}
-            
+        return results
+        
+    except json.JSONDecodeError as e:
+        return {"ERROR": f"Failed to parse JSON response: {str(e)}"}
     except Exception as e:
-        return {"ERROR": f"Unexpected error in document processing: {str(e)}"} 
\ No newline at end of file
+        return {"ERROR": f"Error processing model response: {str(e)}"}
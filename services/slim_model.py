@@ -0,0 +1,166 @@
+"""
+Build and load a slimmed, inference-only copy of the spaCy NER pipeline.
+
+The build step makes NER self-contained (the shared tok2vec listener is
+replaced by an inline copy and the tok2vec component removed), drops word
+vectors, and stores every weight array as a separate ``.npy`` file. Loading
+memory-maps those files copy-on-write, so startup skips deserialising the
+weights and all worker processes share the same pages.
+
+Usage::
+
+    python -m services.slim_model build models/model-best models/model-slim
+    python -m services.slim_model compare models/model-best models/model-slim
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import spacy
+
+MANIFEST = 'mmap_manifest.json'
+ARRAY_DIR = 'arrays'
+
+
+def is_slim(model_path):
+    return os.path.exists(os.path.join(model_path, MANIFEST))
+
+
+def weight_nodes(nlp):
+    """(component, node index, node, parameter name) for every weight array"""
+    for pipe_name, pipe in nlp.pipeline:
+        model = getattr(pipe, 'model', None)
+        if model is None:
+            continue
+        for index, node in enumerate(model.walk()):
+            for param in node.param_names:
+                if node.has_param(param):
+                    yield pipe_name, index, node, param
+
+
+def build(src, dst):
+    """
+    Export an inference-only pipeline from ``src`` to ``dst``.
+
+    Returns:
+        dict: the manifest describing the memory-mappable arrays
+    """
+    nlp = spacy.load(src)
+
+    # keep only what NER needs
+    ner_config = None
+    if 'tok2vec' in nlp.pipe_names and 'ner' in nlp.pipe_names:
+        nlp.replace_listeners('tok2vec', 'ner', ['model.tok2vec'])
+        # the copied block still points at ${components.tok2vec...}; keep a
+        # resolved copy to write once the tok2vec component is gone
+        ner_config = nlp.config.interpolate()['components']['ner']
+        nlp.remove_pipe('tok2vec')
+    for pipe_name in list(nlp.pipe_names):
+        if pipe_name != 'ner':
+            nlp.remove_pipe(pipe_name)
+    nlp.vocab.reset_vectors(width=0)
+
+    array_dir = os.path.join(dst, ARRAY_DIR)
+    os.makedirs(array_dir, exist_ok=True)
+
+    arrays = []
+    for pipe_name, index, node, param in list(weight_nodes(nlp)):
+        array = np.ascontiguousarray(node.ops.to_numpy(node.get_param(param)))
+        filename = f"{pipe_name}_{index}_{node.name}_{param}.npy".replace('>', '').replace('|', '_')
+        np.save(os.path.join(array_dir, filename), array)
+        arrays.append({'pipe': pipe_name, 'index': index, 'node': node.name, 'param': param,
+                       'file': filename, 'shape': list(array.shape), 'dtype': str(array.dtype)})
+        # the serialised model keeps a placeholder only; the real weights
+        # come from the memory-mapped file
+        node.set_param(param, np.zeros((0,), dtype=array.dtype))
+
+    nlp.to_disk(dst)
+    if ner_config is not None:
+        config_path = os.path.join(dst, 'config.cfg')
+        config = spacy.util.load_config(config_path, interpolate=False)
+        config['components']['ner'] = ner_config
+        config.to_disk(config_path)
+    manifest = {'source': os.path.abspath(src), 'arrays': arrays}
+    with open(os.path.join(dst, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load(model_path):
+    """
+    Load a pipeline written by build(), memory-mapping its weight arrays.
+    """
+    nlp = spacy.load(model_path)
+    with open(os.path.join(model_path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    nodes = {}
+    for pipe_name, pipe in nlp.pipeline:
+        model = getattr(pipe, 'model', None)
+        if model is not None:
+            nodes[pipe_name] = list(model.walk())
+
+    for entry in manifest['arrays']:
+        node = nodes[entry['pipe']][entry['index']]
+        if node.name != entry['node']:
+            raise ValueError(f"Model layout changed: expected {entry['node']}, found {node.name}")
+        # copy-on-write: pages stay shared between workers, but thinc's
+        # kernels still get the writable buffers they ask for
+        array = np.load(os.path.join(model_path, ARRAY_DIR, entry['file']), mmap_mode='c')
+        node.set_param(entry['param'], array)
+    return nlp
+
+
+def measure(model_path):
+    """Startup time and memory of loading the model in a fresh process"""
+    code = (
+        "import os, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import services.slim_model as slim\n"
+        "import spacy\n"
+        "path = sys.argv[1]\n"
+        "nlp = slim.load(path) if slim.is_slim(path) else spacy.load(path)\n"
+        "nlp('John Smith CEO Acme 5551234567 john@acme.com')\n"
+        "elapsed = time.perf_counter() - start\n"
+        "page = os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)\n"
+        "size, resident, shared = [int(x) for x in open('/proc/self/statm').read().split()[:3]]\n"
+        "print(elapsed, resident * page, shared * page)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code, model_path], cwd=root,
+                            capture_output=True, text=True, check=True).stdout
+    elapsed, rss, shared = map(float, output.split()[-3:])
+    return {'startup_seconds': round(elapsed, 3), 'rss_mb': round(rss, 1), 'shared_mb': round(shared, 1)}
+
+
+def compare(paths, runs=3):
+    for model_path in paths:
+        results = [measure(model_path) for _ in range(runs)]
+        best = min(results, key=lambda r: r['startup_seconds'])
+        print(f"{model_path:<30} startup {best['startup_seconds']:.3f}s  "
+              f"RSS {best['rss_mb']:.1f} MB  shared {best['shared_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Slim, memory-mappable NER pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='export an inference-only pipeline')
+    build_parser.add_argument('src')
+    build_parser.add_argument('dst')
+    compare_parser = subparsers.add_parser('compare', help='startup time and RSS per model directory')
+    compare_parser.add_argument('paths', nargs='+')
+    compare_parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build(args.src, args.dst)
+        print(f"Wrote {len(manifest['arrays'])} memory-mappable arrays to {args.dst}")
+    else:
+        compare(args.paths, args.runs)
+
+
+if __name__ == '__main__':
+    main()
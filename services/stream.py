@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config.settings as settings
+import utils.ingest as ingest
+import utils.orientation as orientation
+import services.batch as batch
+import services.contacts as contacts
+from utils.tracking import QuadTracker
+
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+_streams = {}
+_lock = threading.Lock()
+# OCR runs off the frame path so tracking keeps up with the camera
+_executor = ThreadPoolExecutor(max_workers=2)
+
+
+class Stream():
+    def __init__(self, ocr_model):
+        self.id = uuid.uuid4().hex
+        self.ocr_model = ocr_model
+        self.tracker = QuadTracker()
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+        self.frames = 0
+        self.job = None
+        self.captures = []
+
+    def extract(self, card):
+        card, angle, method = orientation.normalize_orientation(card)
+        backend, results, overlay = batch.run_backend(card, self.ocr_model)
+        contacts.record_scan(results, backend)
+        return {'backend': backend, 'results': results, 'overlay': overlay,
+                'rotation': angle, 'captured_at': time.time()}
+
+
+def expire_streams():
+    now = time.time()
+    with _lock:
+        for stream_id in [k for k, v in _streams.items()
+                          if now - v.last_seen > settings.STREAM_IDLE_TIMEOUT]:
+            del _streams[stream_id]
+
+
+def create_stream(ocr_model='pytesseract'):
+    expire_streams()
+    stream = Stream(ocr_model)
+    with _lock:
+        _streams[stream.id] = stream
+    return stream.id
+
+
+def close_stream(stream_id):
+    with _lock:
+        return _streams.pop(stream_id, None) is not None
+
+
+def get_stream(stream_id):
+    with _lock:
+        return _streams.get(stream_id)
+
+
+def decode_frame(frame_bytes):
+    # frames get the same header checks as single uploads, so a forged
+    # size can't make OpenCV allocate a huge image
+    frame, _ = ingest.decode_image(frame_bytes, counter='frames')
+    return frame
+
+
+def process_frame(stream_id, frame_bytes):
+    """
+    Track the card in one encoded frame of a stream. OCR is queued once the
+    card has been stable and sharp for STREAM_STABLE_FRAMES frames; its
+    result is reported with the following frames.
+
+    Returns:
+        dict: tracker state, OCR status and the latest capture, or None when
+              the stream doesn't exist
+    """
+    stream = get_stream(stream_id)
+    if stream is None:
+        return None
+
+    try:
+        frame = decode_frame(frame_bytes)
+    except ingest.UploadRejected as e:
+        return {'error': e.message, 'reason': e.reason}
+
+    with stream.lock:
+        stream.last_seen = time.time()
+        stream.frames += 1
+        state = stream.tracker.update(frame)
+
+        if state['ready'] and stream.job is None:
+            card = stream.tracker.warp(frame)
+            stream.tracker.captured = True
+            stream.job = _executor.submit(stream.extract, card)
+            print(f"Stream {stream_id}: card stable for {state['stable_frames']} frames, running OCR")
+
+        if stream.job is not None and stream.job.done():
+            try:
+                stream.captures.append(stream.job.result())
+            except Exception as e:
+                stream.captures.append({'results': {"ERROR": f"Error in document processing: {str(e)}"}})
+            stream.job = None
+
+        state['frame'] = stream.frames
+        state['processing'] = stream.job is not None
+        state['capture'] = stream.captures[-1] if stream.captures else None
+        state['captures'] = len(stream.captures)
+    return state
+
+
+def iter_mjpeg_frames(stream, chunk_size=64 * 1024, max_frame_bytes=None):
+    """
+    Split a multipart/x-mixed-replace (MJPEG) or plain concatenated JPEG
+    byte stream into individual JPEG frames without buffering the whole body.
+    A frame still open after max_frame_bytes is dropped and the splitter
+    resyncs on the next frame start, so a client that never ends a frame
+    can't grow the buffer without bound.
+    """
+    max_frame_bytes = max_frame_bytes or settings.UPLOAD_MAX_BYTES
+    buffer = bytearray()
+    # 0 while looking for a frame start, otherwise the offset the search
+    # for the frame's end resumes from
+    scanned = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            if not scanned:
+                start = buffer.find(JPEG_START)
+                if start == -1:
+                    del buffer[:-1]
+                    break
+                del buffer[:start]
+                scanned = 2
+            end = buffer.find(JPEG_END, scanned)
+            if end == -1:
+                if len(buffer) > max_frame_bytes:
+                    print(f"Dropping an MJPEG frame over {max_frame_bytes} bytes")
+                    del buffer[:-1]
+                    scanned = 0
+                else:
+                    # the end marker may straddle the next chunk
+                    scanned = max(len(buffer) - 1, 2)
+                break
+            yield bytes(buffer[:end + 2])
+            del buffer[:end + 2]
+            scanned = 0
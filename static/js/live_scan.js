@@ -0,0 +1,145 @@
+// Live scanning: frames are sent one at a time (the next frame is only
+// captured once the previous answer arrived), so the client never queues
+// more work than the server can track.
+var liveStreamId = null;
+var liveRunning = false;
+var liveMediaStream = null;
+var lastCaptureCount = 0;
+var frameWidth = 640;
+
+function drawQuad(ctx, state, scale) {
+    if (!state.quad) {
+        return;
+    }
+    ctx.beginPath();
+    for (var i = 0; i < state.quad.length; i++) {
+        var pt = state.quad[i];
+        var x = pt.x * scale;
+        var y = pt.y * scale;
+        if (i === 0) {
+            ctx.moveTo(x, y);
+        } else {
+            ctx.lineTo(x, y);
+        }
+    }
+    ctx.closePath();
+    ctx.lineWidth = 3;
+    ctx.strokeStyle = state.stable_frames > 0 ? "#76FF03" : "#FFFF00";
+    ctx.stroke();
+}
+
+function showResults(capture) {
+    var tbody = document.getElementById("liveResults");
+    tbody.innerHTML = "";
+    var results = capture.results || {};
+    var entities = results.entities || results;
+    for (var key in entities) {
+        var row = document.createElement("tr");
+        var keyCell = document.createElement("td");
+        keyCell.className = "fw-bold text-primary";
+        keyCell.textContent = key;
+        var valueCell = document.createElement("td");
+        var value = entities[key];
+        valueCell.textContent = Array.isArray(value) ? value.join(", ") : JSON.stringify(value);
+        row.appendChild(keyCell);
+        row.appendChild(valueCell);
+        tbody.appendChild(row);
+    }
+}
+
+function sendFrame() {
+    if (!liveRunning) {
+        return;
+    }
+    var video = document.getElementById("liveVideo");
+    var canvas = document.getElementById("liveCanvas");
+    var ctx = canvas.getContext("2d");
+    var scale = frameWidth / video.videoWidth;
+    canvas.width = frameWidth;
+    canvas.height = Math.round(video.videoHeight * scale);
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+
+    canvas.toBlob(function(blob) {
+        fetch("/stream/" + liveStreamId + "/frame", {
+            method: "POST",
+            headers: {"Content-Type": "image/jpeg"},
+            body: blob
+        })
+        .then(response => response.json())
+        .then(state => {
+            // quad coordinates are relative to the server's resized frame
+            drawQuad(ctx, state, canvas.width / state.size.width);
+            var status = document.getElementById("liveStatus");
+            if (state.processing) {
+                status.textContent = "Card captured, extracting text...";
+            } else if (state.quad) {
+                status.textContent = "Card found, hold still (" + state.stable_frames + ")";
+            } else {
+                status.textContent = "Looking for a card...";
+            }
+            if (state.capture && state.captures !== lastCaptureCount) {
+                lastCaptureCount = state.captures;
+                showResults(state.capture);
+                status.textContent = "Text extracted (" + (state.capture.backend || "") + ")";
+            }
+            requestAnimationFrame(sendFrame);
+        })
+        .catch(error => {
+            console.error("Error sending frame:", error);
+            setTimeout(sendFrame, 500);
+        });
+    }, "image/jpeg", 0.8);
+}
+
+function startLiveScan() {
+    var model = document.getElementById("liveOcrModel").value;
+    fetch("/stream/start", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({"ocr_model": model})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.status !== "success") {
+            document.getElementById("liveStatus").textContent = data.message;
+            return;
+        }
+        liveStreamId = data.stream_id;
+        return navigator.mediaDevices.getUserMedia({video: {facingMode: "environment"}})
+            .then(mediaStream => {
+                liveMediaStream = mediaStream;
+                var video = document.getElementById("liveVideo");
+                video.srcObject = mediaStream;
+                video.onloadedmetadata = function() {
+                    liveRunning = true;
+                    document.getElementById("liveStart").disabled = true;
+                    document.getElementById("liveStop").disabled = false;
+                    sendFrame();
+                };
+            });
+    })
+    .catch(error => {
+        console.error("Error starting live scan:", error);
+        document.getElementById("liveStatus").textContent = "Could not start the camera";
+    });
+}
+
+function stopLiveScan() {
+    liveRunning = false;
+    if (liveMediaStream) {
+        liveMediaStream.getTracks().forEach(track => track.stop());
+        liveMediaStream = null;
+    }
+    if (liveStreamId) {
+        fetch("/stream/" + liveStreamId + "/stop", {method: "POST"});
+        liveStreamId = null;
+    }
+    document.getElementById("liveStart").disabled = false;
+    document.getElementById("liveStop").disabled = true;
+    document.getElementById("liveStatus").textContent = "Camera stopped";
+}
+
+document.addEventListener("DOMContentLoaded", function() {
+    document.getElementById("liveStart").onclick = startLiveScan;
+    document.getElementById("liveStop").onclick = stopLiveScan;
+});
@@ -0,0 +1,245 @@
+"""
+Upload ingestion: uploads are decoded straight from the request body in
+memory. The byte limit is enforced while the body is read and the pixel
+limit from the image header, both before the image is fully decoded.
+"""
+import io
+import struct
+
+import cv2
+import numpy as np
+from flask import Request
+
+import config.settings as settings
+import utils.metrics as metrics
+
+REJECTION_MESSAGES = {
+    'empty': 'No image was uploaded.',
+    'too_large': 'The file is too large. Upload an image smaller than {max_mb:.0f} MB.',
+    'too_many_pixels': 'The image resolution is too high. Downscale it to at most {max_mp:.0f} megapixels.',
+    'heic': 'HEIC/HEIF photos are not supported. Convert the photo to JPEG before uploading.',
+    'unsupported': 'Unsupported image format. Upload a JPEG, PNG or WebP image.',
+    'corrupt': 'The image could not be decoded. The file may be corrupted.',
+}
+STATUS_CODES = {
+    'empty': 400,
+    'too_large': 413,
+    'too_many_pixels': 413,
+    'heic': 415,
+    'unsupported': 415,
+    'corrupt': 400,
+}
+MIMETYPES = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+# JPEG start-of-frame markers carrying the image size (not DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejected(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+        self.status = STATUS_CODES[reason]
+        self.message = REJECTION_MESSAGES[reason].format(
+            max_mb=settings.UPLOAD_MAX_BYTES / 2**20,
+            max_mp=settings.UPLOAD_MAX_PIXELS / 1e6)
+        super().__init__(self.message)
+
+
+class InMemoryRequest(Request):
+    # a live MJPEG stream runs for as long as the camera does; only the
+    # single upload routes are bound by MAX_CONTENT_LENGTH
+    unlimited_endpoints = ('stream_mjpeg',)
+
+    @property
+    def max_content_length(self):
+        if self.endpoint in self.unlimited_endpoints:
+            return None
+        return super().max_content_length
+
+    # Werkzeug spools file parts over 500 KB to a temporary file; keep them
+    # in memory instead, MAX_CONTENT_LENGTH bounds their size
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+def sniff_format(data):
+    """Image format from the file's magic bytes, None when unknown"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[4:8] == b'ftyp' and data[8:12] in HEIF_BRANDS:
+        return 'heic'
+    return None
+
+
+def jpeg_size(data):
+    # walk the marker segments up to the first start-of-frame
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0x01,) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def png_size(data):
+    if len(data) < 24 or data[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', data[16:24])
+
+
+def webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height
+    return None
+
+
+SIZE_PARSERS = {'jpeg': jpeg_size, 'png': png_size, 'webp': webp_size}
+
+
+def image_size(data, image_format):
+    """(width, height) read from the image header, None if it can't be parsed"""
+    try:
+        return SIZE_PARSERS[image_format](data)
+    except (struct.error, IndexError):
+        return None
+
+
+def read_limited(stream, max_bytes=None, chunk_size=256 * 1024):
+    """Read a stream into memory, giving up as soon as it exceeds max_bytes"""
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadRejected('too_large')
+    return buffer
+
+
+def upload_buffer(file_storage, max_bytes=None):
+    """The uploaded file's bytes, without a copy when it is held in memory"""
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    stream = file_storage.stream
+    if isinstance(stream, io.BytesIO):
+        data = stream.getbuffer()
+        if len(data) > max_bytes:
+            raise UploadRejected('too_large')
+        return data
+    return read_limited(stream, max_bytes)
+
+
+def decode_image(data, max_pixels=None, counter='uploads'):
+    """
+    Check an encoded image's format and dimensions from its header, then
+    decode it with OpenCV. Outcomes are counted in metrics as
+    ``<counter>.checked`` and ``<counter>.rejected.<reason>``.
+
+    Returns:
+        tuple: BGR image and a dict with the raw bytes, format, mimetype,
+               width, height and size in bytes
+    Raises:
+        UploadRejected: when the image is empty, too large, in an
+                        unsupported format or can't be decoded
+    """
+    max_pixels = max_pixels or settings.UPLOAD_MAX_PIXELS
+    metrics.increment(counter + '.checked')
+    try:
+        if len(data) == 0:
+            raise UploadRejected('empty')
+
+        image_format = sniff_format(bytes(data[:32]))
+        if image_format == 'heic':
+            raise UploadRejected('heic')
+        if image_format not in settings.UPLOAD_FORMATS:
+            raise UploadRejected('unsupported')
+
+        # only the header is parsed here, so an oversized image is refused
+        # before OpenCV allocates its pixels
+        size = image_size(data, image_format)
+        if size is None:
+            raise UploadRejected('corrupt')
+        width, height = size
+        if width * height > max_pixels:
+            raise UploadRejected('too_many_pixels')
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise UploadRejected('corrupt')
+    except UploadRejected as e:
+        metrics.increment(counter + '.rejected')
+        metrics.increment(counter + '.rejected.' + e.reason)
+        raise
+
+    upload = {
+        'data': data,
+        'format': image_format,
+        'mimetype': MIMETYPES[image_format],
+        'width': image.shape[1],
+        'height': image.shape[0],
+        'bytes': len(data),
+    }
+    return image, upload
+
+
+def decode_upload(file_storage):
+    """
+    Decode an uploaded file (werkzeug FileStorage) held in memory. The
+    decode reads the request buffer directly; only the encoded bytes are
+    copied so they outlive the request.
+    """
+    data = upload_buffer(file_storage)
+    try:
+        image, upload = decode_image(data)
+        upload['data'] = bytes(data)
+    finally:
+        # an exported view keeps Werkzeug from closing the buffer
+        if isinstance(data, memoryview):
+            data.release()
+    return image, upload
+
+
+def encode_upload(upload, image, formats=('jpeg',)):
+    """
+    Encoded bytes of the upload for backends that accept only some formats:
+    the original bytes when possible, otherwise the image as a JPEG.
+    """
+    if upload is not None and upload['format'] in formats:
+        return bytes(upload['data'])
+    _, buffer = cv2.imencode('.jpg', image)
+    return buffer.tobytes()
+
+
+def upload_policy():
+    """Limits for clients that can convert or downscale before uploading"""
+    return {
+        'max_bytes': settings.UPLOAD_MAX_BYTES,
+        'max_pixels': settings.UPLOAD_MAX_PIXELS,
+        'formats': [MIMETYPES[image_format] for image_format in settings.UPLOAD_FORMATS],
+        'recommended_max_side': settings.UPLOAD_RECOMMENDED_MAX_SIDE,
+    }
@@ -0,0 +1,32 @@
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot():
+    """
+    Return a copy of all counters together with the derived rates
+    (``<prefix>.skip_rate`` for every ``<prefix>.checked`` counter).
+    """
+    with _lock:
+        counters = dict(_counters)
+
+    rates = {}
+    for name, checked in counters.items():
+        if name.endswith('.checked') and checked:
+            prefix = name[:-len('.checked')]
+            rates[prefix + '.skip_rate'] = round(counters.get(prefix + '.rejected', 0) / checked, 4)
+
+    return {'counters': counters, 'rates': rates}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+import pytesseract
+
+import config.settings as settings
+
+ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def rotate(image, angle):
+    """Rotate the image clockwise by a multiple of 90 degrees"""
+    angle = angle % 360
+    if angle == 0:
+        return image
+    return cv2.rotate(image, ROTATIONS[angle])
+
+
+def binarize(image, size=600):
+    # downscale so the longest side is `size` pixels; text becomes white
+    h, w = image.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    # local threshold keeps thin strokes and ignores large dark areas
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                   cv2.THRESH_BINARY_INV, 25, 15)
+    return binary
+
+
+def line_segments(binary):
+    """
+    Smear characters horizontally into text-line segments and return the
+    bounding boxes (x, y, w, h) of the segments that look like a line of text.
+    Working per segment rather than on whole-image rows keeps multi-column
+    card layouts from blurring the profiles together. Segments touching the
+    image edge or taller than a text line can be are card frames and
+    background left over from the warp, not text.
+    """
+    img_h, img_w = binary.shape[:2]
+    max_h = settings.ORIENTATION_MAX_LINE_HEIGHT * min(img_h, img_w)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 1))
+    smeared = cv2.dilate(binary, kernel)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(smeared)
+    segments = []
+    for i in range(1, n):
+        x, y, w, h = stats[i][:4]
+        if h < 6 or w < 3 * h or h > max_h:
+            continue
+        if x == 0 or y == 0 or x + w >= img_w or y + h >= img_h:
+            continue
+        segments.append((x, y, w, h))
+    return segments
+
+
+def lineness(binary):
+    # total length of horizontal text-line segments
+    return float(sum(w for _, _, w, _ in line_segments(binary)))
+
+
+def upright_score(binary):
+    """
+    Compare the ink above and below the x-height body of every text line,
+    found from the line's row projection profile. Latin capitals and
+    ascenders are far more common than descenders, so an upright line carries
+    more ink above its body. Positive means upright, negative upside down;
+    the magnitude is in [0, 1].
+    """
+    votes = total = 0.0
+    for x, y, w, h in line_segments(binary):
+        profile = binary[y:y + h, x:x + w].sum(axis=1).astype(np.float64)
+        body = np.where(profile > 0.5 * profile.max())[0]
+        above = profile[:body[0]].sum()
+        below = profile[body[-1] + 1:].sum()
+        if above + below == 0:
+            continue
+        votes += (above - below) / (above + below) * w
+        total += w
+    if total == 0:
+        return 0.0
+    return float(votes / total)
+
+
+def estimate_orientation(image):
+    """
+    Estimate how far a card has to be rotated clockwise to be upright using
+    text-line statistics and the aspect ratio only.
+
+    Returns:
+        tuple: (angle in {0, 90, 180, 270}, ambiguous flag, fallback angle
+               that is safe to apply when the estimate is ambiguous and OSD
+               can't decide: the 0/90 line direction if its margin is
+               confident, otherwise 0)
+    """
+    binary = binarize(image)
+    h, w = binary.shape[:2]
+
+    horizontal = lineness(binary)
+    vertical = lineness(rotate(binary, 90))
+    # cards are usually landscape: use the aspect ratio as a weak prior
+    aspect_prior = settings.ORIENTATION_ASPECT_WEIGHT * np.log(w / h)
+    line_score = np.log((horizontal + 1.0) / (vertical + 1.0)) + aspect_prior
+
+    if line_score >= 0:
+        lines_angle, lines_binary = 0, binary
+    else:
+        lines_angle, lines_binary = 90, rotate(binary, 90)
+
+    up = upright_score(lines_binary)
+    angle = lines_angle if up >= 0 else (lines_angle + 180) % 360
+
+    lines_confident = abs(line_score) >= settings.ORIENTATION_MIN_LINE_MARGIN
+    ambiguous = not lines_confident or abs(up) < settings.ORIENTATION_MIN_UPRIGHT_MARGIN
+    fallback = lines_angle if lines_confident else 0
+    return angle, ambiguous, fallback
+
+
+def osd_orientation(image):
+    """Single Tesseract OSD call, None when OSD can't decide"""
+    try:
+        osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+        return int(osd['rotate']) % 360
+    except Exception as e:
+        print(f"Tesseract OSD failed: {str(e)}")
+        return None
+
+
+def normalize_orientation(image):
+    """
+    Rotate a warped card upright once before OCR. Tesseract OSD is only
+    consulted when the image statistics are ambiguous.
+
+    Returns:
+        tuple: (upright image, applied clockwise angle, method used)
+    """
+    angle, ambiguous, fallback = estimate_orientation(image)
+    method = 'profile'
+    if ambiguous:
+        osd_angle = osd_orientation(image)
+        if osd_angle is not None:
+            angle, method = osd_angle, 'osd'
+        else:
+            # a weak up/down guess flips upright cards as often as it fixes
+            # upside-down ones; keep only what is confident
+            angle, method = fallback, 'lines'
+
+    return rotate(image, angle), angle, method
@@ -0,0 +1,91 @@
+import time
+
+import cv2
+import numpy as np
+
+import config.settings as settings
+import utils.metrics as metrics
+
+REJECTION_MESSAGES = {
+    'too_small': 'The card is too small in the image. Move closer or upload a higher resolution photo.',
+    'too_dark': 'The image is too dark. Retake the photo with more light.',
+    'too_bright': 'The image is overexposed. Avoid glare and direct light.',
+    'blurry': 'The image is too blurry. Hold the camera steady and retake the photo.',
+    'no_text': 'No text could be found on the card.',
+}
+
+
+def quality_scores(image, width=500):
+    """
+    Cheap image statistics used by the quality gate. The image is downscaled
+    to a fixed width first so the scores don't depend on the upload size and
+    the whole check stays in the order of milliseconds.
+    """
+    h, w = image.shape[:2]
+    small = cv2.resize(image, (width, max(int(h / w * width), 1)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    brightness = gray.mean()
+    clipped = np.count_nonzero((gray <= 5) | (gray >= 250)) / gray.size
+    edges = cv2.Canny(gray, 75, 200)
+    text_density = np.count_nonzero(edges) / edges.size
+
+    return {
+        'width': int(w),
+        'height': int(h),
+        'sharpness': round(float(sharpness), 2),
+        'brightness': round(float(brightness), 2),
+        'clipped': round(float(clipped), 4),
+        'text_density': round(float(text_density), 4),
+    }
+
+
+def check_image_quality(image):
+    """
+    Pre-flight check run before the expensive backends.
+
+    Args:
+        image (numpy.ndarray): BGR image (warped card or original upload)
+
+    Returns:
+        dict: ``ok`` flag, rejection ``reason`` code and ``message`` (None when
+              the image passes), the raw ``scores`` and the time taken in ms
+    """
+    start = time.perf_counter()
+    metrics.increment('quality.checked')
+
+    if image is None or image.size == 0:
+        scores = {}
+        reason = 'too_small'
+    else:
+        scores = quality_scores(image)
+        min_w, min_h = settings.QUALITY_MIN_SIZE
+        long_side = max(scores['width'], scores['height'])
+        short_side = min(scores['width'], scores['height'])
+
+        if long_side < min_w or short_side < min_h:
+            reason = 'too_small'
+        elif scores['brightness'] < settings.QUALITY_MIN_BRIGHTNESS:
+            reason = 'too_dark'
+        elif scores['brightness'] > settings.QUALITY_MAX_BRIGHTNESS or \
+                scores['clipped'] > settings.QUALITY_MAX_CLIPPED:
+            reason = 'too_bright'
+        elif scores['sharpness'] < settings.QUALITY_MIN_SHARPNESS:
+            reason = 'blurry'
+        elif scores['text_density'] < settings.QUALITY_MIN_TEXT_DENSITY:
+            reason = 'no_text'
+        else:
+            reason = None
+
+    if reason is not None:
+        metrics.increment('quality.rejected')
+        metrics.increment('quality.rejected.' + reason)
+
+    return {
+        'ok': reason is None,
+        'reason': reason,
+        'message': REJECTION_MESSAGES.get(reason),
+        'scores': scores,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
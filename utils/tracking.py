@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+from imutils.perspective import order_points
+
+import config.settings as settings
+from utils.utils import DocumentScan
+
+
+class QuadTracker():
+    """
+    Track a card quadrilateral across camera frames.
+
+    Once a card has been found, detection only runs in a window around the
+    previous quad (falling back to the full frame when the card is lost),
+    the corners are smoothed with an exponential moving average and the
+    tracker reports when the card has been still and sharp for enough
+    consecutive frames to be worth sending to OCR.
+    """
+
+    def __init__(self, width=500):
+        self.width = width
+        self.scanner = DocumentScan()
+        self.reset()
+
+    def reset(self):
+        self.quad = None
+        self.stable_frames = 0
+        self.misses = 0
+        self.captured = False
+
+    def detect(self, img_re):
+        h, w = img_re.shape[:2]
+        if self.quad is not None:
+            # search a window around the previous position first
+            x, y, bw, bh = cv2.boundingRect(self.quad.astype(np.int32))
+            mx, my = int(bw * 0.25), int(bh * 0.25)
+            x0, y0 = max(x - mx, 0), max(y - my, 0)
+            x1, y1 = min(x + bw + mx, w), min(y + bh + my, h)
+            candidates = self.scanner.find_cards(img_re[y0:y1, x0:x1], enhance=False)
+            candidates = [c + np.array([x0, y0]) for c in candidates]
+            if candidates:
+                return min(candidates, key=self.distance)
+
+        candidates = self.scanner.find_cards(img_re, enhance=False)
+        if not candidates:
+            return None
+        if self.quad is None:
+            return candidates[0]
+        return min(candidates, key=self.distance)
+
+    def distance(self, quad):
+        # mean corner displacement from the tracked quad
+        return float(np.linalg.norm(order_points(quad.astype(np.float32)) - self.quad, axis=1).mean())
+
+    @staticmethod
+    def sharpness(img_re, quad):
+        x, y, bw, bh = cv2.boundingRect(quad.astype(np.int32))
+        crop = img_re[max(y, 0):y + bh, max(x, 0):x + bw]
+        if crop.size == 0:
+            return 0.0
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    def update(self, frame):
+        """
+        Feed one BGR frame.
+
+        Returns:
+            dict: tracked quad (resized coordinates), motion, sharpness,
+                  stable frame count and ``ready`` when OCR should fire
+        """
+        img_re, size = DocumentScan.resizer(frame, self.width)
+        detected = self.detect(img_re)
+
+        if detected is None:
+            self.misses += 1
+            self.stable_frames = 0
+            if self.misses >= settings.STREAM_MAX_MISSES:
+                self.reset()
+            return self.state(size, motion=None, sharpness=None)
+
+        self.misses = 0
+        detected = order_points(detected.astype(np.float32))
+        if self.quad is None:
+            motion = float('inf')
+            self.quad = detected
+        else:
+            motion = float(np.linalg.norm(detected - self.quad, axis=1).mean())
+            alpha = settings.STREAM_SMOOTHING
+            self.quad = alpha * detected + (1 - alpha) * self.quad
+
+        sharpness = self.sharpness(img_re, self.quad)
+        if motion <= settings.STREAM_MAX_MOTION and sharpness >= settings.STREAM_MIN_SHARPNESS:
+            self.stable_frames += 1
+        else:
+            self.stable_frames = 0
+            # a card that moved after capture can be captured again
+            if motion > 4 * settings.STREAM_MAX_MOTION:
+                self.captured = False
+
+        return self.state(size, motion, sharpness)
+
+    def state(self, size, motion, sharpness):
+        ready = self.quad is not None and not self.captured and \
+            self.stable_frames >= settings.STREAM_STABLE_FRAMES
+        return {
+            'size': {'width': size[0], 'height': size[1]},
+            'quad': None if self.quad is None else
+                [{'x': float(x), 'y': float(y)} for x, y in self.quad],
+            'motion': None if motion is None or motion == float('inf') else round(motion, 2),
+            'sharpness': None if sharpness is None else round(sharpness, 1),
+            'stable_frames': self.stable_frames,
+            'ready': ready,
+        }
+
+    def warp(self, frame):
+        """Warp the full resolution frame with the smoothed quad"""
+        self.scanner.image = frame
+        self.scanner.size = (self.width, int(frame.shape[0] / frame.shape[1] * self.width))
+        return self.scanner.calibrate_to_original_size(self.quad)
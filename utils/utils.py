@@ -5,18 +5,6 @@ import numpy as np
 from imutils.perspective import four_point_transform
 
 
-def save_upload_image(fileObj):
-    filename = fileObj.filename    
-    name , ext = filename.split('.')    
-    save_filename = 'upload.'+ext
-    upload_image_path = settings.join_path(settings.SAVE_DIR, 
-                                           save_filename)
-    
-    fileObj.save(upload_image_path)
-    
-    return upload_image_path
-
-
 def array_to_json_format(numpy_array):
     points = []
     for pt in numpy_array.tolist():
@@ -27,7 +15,10 @@ def array_to_json_format(numpy_array):
 
 class DocumentScan():
     def __init__(self):
-        pass
+        self.image = None
+        self.upload = None
+        # uncorrected warp of the last transform, scored by the quality gate
+        self.wrap_image = None
     
     @staticmethod
     def resizer(image,width=500):
@@ -65,8 +56,26 @@ class DocumentScan():
 
         return buf
     
+    @staticmethod
+    def edge_map(img_re, enhance=True):
+        # detailEnhance dominates the cost; the live tracker skips it
+        detail = cv2.detailEnhance(img_re,sigma_s = 20, sigma_r = 0.15) if enhance else img_re
+        gray = cv2.cvtColor(detail,cv2.COLOR_BGR2GRAY) # GRAYSCALE IMAGE
+        blur = cv2.GaussianBlur(gray,(5,5),0)
+        # edge detect
+        edge_image = cv2.Canny(blur,75,200)
+        # morphological transform
+        kernel = np.ones((5,5),np.uint8)
+        dilate = cv2.dilate(edge_image,kernel,iterations=1)
+        closing = cv2.morphologyEx(dilate,cv2.MORPH_CLOSE,kernel)
+        return closing
+
     def document_scanner(self,image_path):
-        self.image = cv2.imread(image_path)
+        return self.document_scanner_image(cv2.imread(image_path))
+
+    def document_scanner_image(self,image):
+        """Locate the document in an image already decoded in memory"""
+        self.image = image
         img_re,self.size = self.resizer(self.image)
         filename = 'resize_image.jpg'
         RESIZE_IMAGE_PATH = settings.join_path(settings.MEDIA_DIR,filename)
@@ -74,16 +83,7 @@ class DocumentScan():
         cv2.imwrite(RESIZE_IMAGE_PATH,img_re)
         
         try:
-                
-            detail = cv2.detailEnhance(img_re,sigma_s = 20, sigma_r = 0.15)
-            gray = cv2.cvtColor(detail,cv2.COLOR_BGR2GRAY) # GRAYSCALE IMAGE
-            blur = cv2.GaussianBlur(gray,(5,5),0)
-            # edge detect
-            edge_image = cv2.Canny(blur,75,200)
-            # morphological transform
-            kernel = np.ones((5,5),np.uint8)
-            dilate = cv2.dilate(edge_image,kernel,iterations=1)
-            closing = cv2.morphologyEx(dilate,cv2.MORPH_CLOSE,kernel)
+            closing = self.edge_map(img_re)
 
             # find the contours
             contours , hire = cv2.findContours(closing,
@@ -103,15 +103,89 @@ class DocumentScan():
                 
         except:
             return None, self.size
+
+    @staticmethod
+    def is_card_shaped(quad, image_area):
+        if not cv2.isContourConvex(quad):
+            return False
+        area = cv2.contourArea(quad)
+        if area < settings.MULTI_CARD_MIN_AREA * image_area:
+            return False
+        (_, _), (w, h), _ = cv2.minAreaRect(quad)
+        if min(w, h) == 0:
+            return False
+        ratio = max(w, h) / min(w, h)
+        min_ratio, max_ratio = settings.MULTI_CARD_ASPECT_RANGE
+        return min_ratio <= ratio <= max_ratio
+
+    @staticmethod
+    def overlap(quad_a, quad_b):
+        # intersection over the smaller area, so nested contours of the
+        # same card (inner border, print frame) are suppressed as well
+        inter, _ = cv2.intersectConvexConvex(quad_a.astype(np.float32),
+                                             quad_b.astype(np.float32))
+        smaller = min(cv2.contourArea(quad_a), cv2.contourArea(quad_b))
+        if smaller == 0:
+            return 0.0
+        return inter / smaller
+
+    def find_cards(self,img_re,enhance=True):
+        """
+        Return every card-shaped quadrilateral in the resized image, largest
+        first, with overlapping detections suppressed.
+        """
+        closing = self.edge_map(img_re, enhance)
+        contours , hire = cv2.findContours(closing,
+                                        cv2.RETR_LIST,
+                                        cv2.CHAIN_APPROX_SIMPLE)
+        contours = sorted(contours, key=cv2.contourArea, reverse=True)
+        image_area = img_re.shape[0] * img_re.shape[1]
+
+        cards = []
+        for contour in contours:
+            peri = cv2.arcLength(contour,True)
+            approx = cv2.approxPolyDP(contour,0.02*peri, True)
+            if len(approx) != 4 or not self.is_card_shaped(approx, image_area):
+                continue
+            # the largest contour can be the whole photo frame
+            if cv2.contourArea(approx) > 0.95 * image_area:
+                continue
+            if any(self.overlap(approx, kept) > settings.MULTI_CARD_MAX_OVERLAP for kept in cards):
+                continue
+            cards.append(approx)
+            if len(cards) >= settings.MULTI_CARD_MAX_CARDS:
+                break
+
+        return [np.squeeze(card) for card in cards]
+
+    def document_scanner_multi_image(self,image):
+        """
+        Locate all cards in a photo of several cards laid out on a table.
+
+        Returns:
+            list of four points (in resized coordinates) and the resized size
+        """
+        self.image = image
+        img_re,self.size = self.resizer(self.image)
+        try:
+            return self.find_cards(img_re), self.size
+        except Exception as e:
+            print(f"Error while locating cards: {str(e)}")
+            return [], self.size
     
     
-    def calibrate_to_original_size(self,four_points):
+    def warp_to_original_size(self,four_points):
         # find four points for original image
         
         multiplier = self.image.shape[1] / self.size[0]
         four_points_orig = four_points * multiplier
         four_points_orig = four_points_orig.astype(int)
         wrap_image = four_point_transform(self.image,four_points_orig)
+        
+        return wrap_image
+    
+    def calibrate_to_original_size(self,four_points):
+        wrap_image = self.warp_to_original_size(four_points)
         # apply magic color to wrap image
         magic_color = self.apply_brightness_contrast(wrap_image,brightness=40,contrast=60)
         